@@ -0,0 +1,431 @@
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, List, Optional
+
+import requests
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:  # Optional, only needed for S3 backups
+    boto3 = None
+    BotoCoreError = ClientError = Exception
+
+from fingerprint import partial_hash
+from resumable_upload import (
+    DEFAULT_CHUNK_SIZE,
+    RETRYABLE_STATUS_CODES,
+    YOUTUBE_UPLOAD_URL,
+    ResumableUploadError,
+    UploadAlreadyComplete,
+    UploadProgress,
+    UploadThrottle,
+    acknowledged_end,
+    adapt_chunk_size,
+    put_chunk,
+    query_upload_offset,
+    start_resumable_session,
+)
+from upload_queue import SinkRecord, UploadQueue, get_default_queue
+from upload_video import get_upload_session
+
+# S3 multipart uploads use parts of this size (over S3's 5 MiB minimum), so a
+# resumed upload continues on a part boundary
+S3_PART_SIZE = DEFAULT_CHUNK_SIZE
+# The file is read in chunks of this size, a multiple of S3_PART_SIZE; it also caps
+# the adaptive YouTube chunk size, trading larger PUTs for bounded read buffers
+FANOUT_READ_SIZE = 4 * S3_PART_SIZE
+PARTIAL_SUFFIX = ".partial"
+
+
+class BackupSink(ABC):
+    """
+    A destination a file is backed up to, chunk by chunk at increasing offsets.
+
+    The blocking methods are run off the event loop by ``fan_out_upload``.
+    ``write`` may persist only the start of the data it is given (e.g. one S3
+    part); it is called again with the rest. ``OSError`` (which includes
+    connection errors) is treated as transient and retried after ``resume``;
+    any other exception fails the sink.
+    """
+
+    name = "sink"
+    throttle: Optional[UploadThrottle] = None
+
+    def previous_result(self, queue: UploadQueue, content_hash: str) -> Optional[str]:
+        """Returns the result of an earlier completed backup of the same content, if any."""
+        record = queue.get_sink(content_hash, self.name)
+        return record.result if record else None
+
+    @abstractmethod
+    def open(self, file_path: Path, size: int, record: Optional[SinkRecord]) -> tuple[str, int]:
+        """Starts a backup or resumes the recorded one; returns its resume state and offset."""
+
+    @abstractmethod
+    def write(self, data: memoryview, offset: int) -> int:
+        """Sends data starting at offset; returns the offset the destination has persisted."""
+
+    def resume(self, offset: int) -> int:
+        """Returns the persisted offset after a transient failure."""
+        return offset
+
+    @abstractmethod
+    def finish(self) -> str:
+        """Completes the backup; returns the video ID, path or URL of the copy."""
+
+
+class YouTubeSink(BackupSink):
+    """
+    Uploads to YouTube through a resumable session.
+
+    Each read chunk is sent in PUTs sized by the measured bandwidth, as in
+    upload_file, up to the fan-out read size.
+    """
+
+    name = "youtube"
+
+    def __init__(
+        self,
+        request_body: dict,
+        upload_url: str = YOUTUBE_UPLOAD_URL,
+        session: Optional[requests.Session] = None,
+        throttle: Optional[UploadThrottle] = None,
+    ):
+        self.request_body = request_body
+        self.upload_url = upload_url
+        self.session = session
+        self.throttle = throttle
+        self.response: dict[str, Any] = {}
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+
+    def previous_result(self, queue: UploadQueue, content_hash: str) -> Optional[str]:
+        # Also recognise videos uploaded on their own by upload_video
+        record = queue.get(content_hash)
+        if record and record.video_id:
+            return record.video_id
+        return super().previous_result(queue, content_hash)
+
+    def open(self, file_path: Path, size: int, record: Optional[SinkRecord]) -> tuple[str, int]:
+        self.session = self.session or get_upload_session()
+        if self.session is None:
+            raise ResumableUploadError("YouTube authentication failed")
+        self.size = size
+        if record and record.state:
+            try:
+                self.session_uri = record.state
+                return record.state, query_upload_offset(self.session, record.state)
+            except UploadAlreadyComplete as e:
+                # Finished in an earlier run whose final response was lost
+                self.response = e.resource
+                return record.state, size
+            except (ResumableUploadError, requests.RequestException) as e:
+                logging.warning(f"Cannot resume upload of {file_path.name}, restarting: {e}")
+        self.session_uri = start_resumable_session(
+            self.session, self.request_body, self.upload_url, size
+        )
+        return self.session_uri, 0
+
+    def write(self, data: memoryview, offset: int) -> int:
+        data = data[: self.chunk_size]
+        started = time.monotonic()
+        response = put_chunk(self.session, self.session_uri, data, offset, self.size)
+        if len(data) and response.status_code in (200, 201, 308):
+            self.chunk_size = adapt_chunk_size(
+                self.chunk_size, len(data), time.monotonic() - started
+            )
+        if response.status_code in (200, 201):
+            self.response = response.json()
+            return offset + len(data)
+        if response.status_code == 308:
+            return acknowledged_end(response)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise ConnectionError(f"HTTP {response.status_code}")
+        raise ResumableUploadError(f"Upload rejected ({response.status_code}): {response.text}")
+
+    def resume(self, offset: int) -> int:
+        return query_upload_offset(self.session, self.session_uri)
+
+    def finish(self) -> str:
+        if not self.response:
+            # Everything was sent in an earlier run; an empty PUT returns the video
+            self.write(memoryview(b""), self.size)
+        return self.response["id"]
+
+
+class FilesystemSink(BackupSink):
+    """Copies into a folder, e.g. a NAS share, through a ``.partial`` file renamed when complete."""
+
+    def __init__(self, folder: Path, throttle: Optional[UploadThrottle] = None):
+        self.folder = folder
+        self.name = f"file:{folder}"
+        self.throttle = throttle
+        self._file = None
+
+    def open(self, file_path: Path, size: int, record: Optional[SinkRecord]) -> tuple[str, int]:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.final_path = self.folder / file_path.name
+        partial_path = self.folder / (file_path.name + PARTIAL_SUFFIX)
+        offset = 0
+        if record and record.state == str(partial_path) and partial_path.exists():
+            # Only what was flushed to disk before the offset was recorded is trusted
+            offset = min(record.offset, partial_path.stat().st_size)
+        self._file = partial_path.open("r+b" if offset else "wb")
+        self._file.truncate(offset)
+        self.partial_path = partial_path
+        return str(partial_path), offset
+
+    def write(self, data: memoryview, offset: int) -> int:
+        self._file.seek(offset)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return offset + len(data)
+
+    def finish(self) -> str:
+        self._file.close()
+        os.replace(self.partial_path, self.final_path)
+        return str(self.final_path)
+
+
+class S3Sink(BackupSink):
+    """
+    Uploads to an S3-compatible bucket (AWS, MinIO) as a multipart upload.
+
+    Every S3_PART_SIZE of the file is one part, so an interrupted upload
+    resumes after the last part the bucket lists for it. Needs boto3;
+    credentials come from the usual AWS environment variables or config files.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        client: Any = None,
+        throttle: Optional[UploadThrottle] = None,
+    ):
+        if client is None:
+            if boto3 is None:
+                raise ImportError("boto3 is required for S3 backups")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.name = f"s3:{endpoint_url or 'aws'}/{bucket}/{prefix}"
+        self.throttle = throttle
+
+    def _listed_parts(self, upload_id: str) -> List[dict]:
+        parts = []
+        paginator = self.client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=self.bucket, Key=self.key, UploadId=upload_id):
+            parts.extend(page.get("Parts", []))
+        return parts
+
+    def open(self, file_path: Path, size: int, record: Optional[SinkRecord]) -> tuple[str, int]:
+        self.key = self.prefix + file_path.name
+        self.parts: List[dict] = []
+        if record and record.state:
+            try:
+                offset = 0
+                listed = sorted(self._listed_parts(record.state), key=lambda p: p["PartNumber"])
+                for part in listed:
+                    # Only a gapless run of full parts from the start can be continued
+                    if (
+                        part["PartNumber"] != len(self.parts) + 1
+                        or part["Size"] != S3_PART_SIZE
+                    ):
+                        break
+                    self.parts.append({"PartNumber": part["PartNumber"], "ETag": part["ETag"]})
+                    offset += part["Size"]
+                self.upload_id = record.state
+                return self.upload_id, offset
+            except (BotoCoreError, ClientError) as e:
+                logging.warning(f"Cannot resume S3 upload of {file_path.name}, restarting: {e}")
+                self.parts = []
+        try:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+        except (BotoCoreError, ClientError) as e:
+            raise ConnectionError(f"Cannot start S3 upload: {e}") from e
+        self.upload_id = response["UploadId"]
+        return self.upload_id, 0
+
+    def write(self, data: memoryview, offset: int) -> int:
+        # One part per call, so part numbers follow from the offset
+        data = data[:S3_PART_SIZE]
+        part_number = offset // S3_PART_SIZE + 1
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=bytes(data),
+            )
+        except (BotoCoreError, ClientError) as e:
+            raise ConnectionError(f"S3 part {part_number} failed: {e}") from e
+        del self.parts[part_number - 1 :]
+        self.parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        return offset + len(data)
+
+    def finish(self) -> str:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+        return f"s3://{self.bucket}/{self.key}"
+
+
+async def write_with_retries(
+    sink: BackupSink, data: memoryview, offset: int, max_retries: int
+) -> int:
+    """Sends a chunk to one sink until it has all been persisted; returns the new offset."""
+    end = offset + len(data)
+    start = offset
+    retry_count = 0
+    while offset < end:
+        try:
+            written = await asyncio.to_thread(sink.write, data[offset - start :], offset)
+        except OSError as e:
+            error = e
+        else:
+            if written > offset:
+                offset = written
+                retry_count = 0
+                continue
+            # Nothing new persisted, so a sink that stops advancing gives up
+            error = ConnectionError(f"no progress past byte {offset}")
+        retry_count += 1
+        if retry_count > max_retries:
+            raise error
+        logging.warning(f"{sink.name}: {error}, retry {retry_count}/{max_retries}")
+        await asyncio.sleep(2**retry_count)
+        try:
+            offset = await asyncio.to_thread(sink.resume, offset)
+        except OSError:
+            pass  # Resent from the same offset
+    return offset
+
+
+async def fan_out_upload(
+    file_path: Path,
+    sinks: List[BackupSink],
+    queue: Optional[UploadQueue] = None,
+    chunk_size: int = FANOUT_READ_SIZE,
+    max_retries: int = 3,
+    on_progress: Optional[UploadProgress] = None,
+) -> dict[str, Optional[str]]:
+    """
+    Backs a file up to several destinations, reading each chunk from disk once.
+
+    Every chunk is handed to all sinks concurrently while the next one is
+    read. Each sink keeps its own offset, retries and resume state in the
+    upload queue: a sink that already holds part of the file from an earlier
+    run only receives the rest, a completed sink is skipped, and a sink that
+    fails is dropped without holding up the others.
+
+    Args:
+        file_path: File to back up
+        sinks: Destinations to send it to
+        queue: Store of per-sink progress, defaults to the project queue
+        chunk_size: Size of each read, a multiple of S3_PART_SIZE; also the
+            largest chunk the YouTube sink sends in one PUT
+        max_retries: Consecutive transient failures tolerated per chunk and sink
+        on_progress: Called with the offset every remaining sink has reached
+
+    Returns:
+        The result of each sink by name (video ID, path or URL), None where it failed
+    """
+    if not file_path.is_file():
+        raise FileNotFoundError(f"Video file not found: {file_path}")
+
+    queue = queue or get_default_queue()
+    content_hash = await asyncio.to_thread(partial_hash, file_path)
+    total = file_path.stat().st_size
+    results: dict[str, Optional[str]] = {}
+    offsets: dict[BackupSink, int] = {}
+
+    for sink in sinks:
+        previous = sink.previous_result(queue, content_hash)
+        if previous:
+            logging.info(f"{file_path.name} is already backed up to {sink.name}: {previous}")
+            results[sink.name] = previous
+            continue
+        try:
+            record = queue.get_sink(content_hash, sink.name)
+            state, offset = await asyncio.to_thread(sink.open, file_path, total, record)
+        except Exception as e:
+            logging.error(f"Cannot start backup of {file_path.name} to {sink.name}: {e}")
+            results[sink.name] = None
+            continue
+        queue.start_sink(content_hash, sink.name, file_path, total, state, offset)
+        offsets[sink] = offset
+
+    def fail(sink: BackupSink, error: BaseException) -> None:
+        logging.error(f"Backup of {file_path.name} to {sink.name} failed: {error}")
+        results[sink.name] = None
+        del offsets[sink]
+
+    buffers = [bytearray(chunk_size), bytearray(chunk_size)]
+
+    with file_path.open("rb", buffering=0) as f:
+
+        def read_at(position: int, slot: int) -> memoryview:
+            view = memoryview(buffers[slot])[: min(chunk_size, total - position)]
+            f.seek(position)
+            filled = 0
+            while filled < len(view) and (n := f.readinto(view[filled:])):
+                filled += n
+            return view[:filled]
+
+        async def feed(sink: BackupSink, chunk: memoryview, position: int) -> None:
+            start = max(offsets[sink], position)
+            if start >= position + len(chunk):
+                return  # This sink already holds the chunk
+            data = chunk[start - position :]
+            if sink.throttle:
+                await sink.throttle(len(data))
+            offsets[sink] = await write_with_retries(sink, data, start, max_retries)
+            queue.update_sink_offset(content_hash, sink.name, offsets[sink])
+
+        if on_progress and offsets:
+            on_progress(min(offsets.values()), total)
+        # Reads stay chunk aligned, so multipart sinks resume on part boundaries
+        position = min(offsets.values(), default=total) // chunk_size * chunk_size
+        slot = 0
+        chunk = await asyncio.to_thread(read_at, position, slot) if position < total else None
+        while chunk is not None and offsets:
+            end = position + len(chunk)
+            prefetch = None
+            if end < total:
+                prefetch = asyncio.create_task(asyncio.to_thread(read_at, end, 1 - slot))
+
+            active = list(offsets)
+            outcomes = await asyncio.gather(
+                *(feed(sink, chunk, position) for sink in active), return_exceptions=True
+            )
+            for sink, outcome in zip(active, outcomes):
+                if isinstance(outcome, BaseException):
+                    fail(sink, outcome)
+            if on_progress and offsets:
+                on_progress(min(offsets.values()), total)
+
+            chunk = await prefetch if prefetch else None
+            position, slot = end, 1 - slot
+
+    active = list(offsets)
+    outcomes = await asyncio.gather(
+        *(asyncio.to_thread(sink.finish) for sink in active), return_exceptions=True
+    )
+    for sink, outcome in zip(active, outcomes):
+        if isinstance(outcome, BaseException):
+            fail(sink, outcome)
+            continue
+        queue.complete_sink(content_hash, sink.name, outcome)
+        results[sink.name] = outcome
+    return results
@@ -0,0 +1,396 @@
+import asyncio
+import http.server
+import json
+import logging
+import re
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional, get_args
+
+import requests
+
+import main as pipeline
+import probe_cache
+import upload_queue
+from backup_sinks import BackupSink, FilesystemSink, YouTubeSink
+from combine_clips import (
+    FASTSTART_ARGS,
+    MuxMode,
+    list_clips,
+    mux_args,
+    run_concat,
+    write_concat_list,
+)
+from ffmpeg_progress import FFmpegMonitor
+from ingest_index import IngestIndex
+from move_files import move_all_files_in_folder
+from upload_queue import UploadQueue
+from upload_scheduler import UploadScheduler
+from upload_video import build_request_body
+
+BENCHMARK_ROOT = probe_cache.CACHE_DIR / "benchmark"
+# Ride start used for the synthetic clips' names and creation_time tags
+RIDE_START = datetime(2024, 1, 6, 6, 30, 0, tzinfo=timezone.utc)
+
+
+def generate_clip(
+    output_path: Path,
+    creation_time: datetime,
+    seconds: float,
+    size: str = "1920x1080",
+    fps: int = 30,
+) -> None:
+    """Encodes a test-pattern clip with a tone, tagged like a camera recording."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc2=size={size}:rate={fps}:duration={seconds}",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=1000:sample_rate=48000:duration={seconds}",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-g",
+            str(fps),
+            "-c:a",
+            "aac",
+            "-metadata",
+            f"creation_time={creation_time.strftime('%Y-%m-%dT%H:%M:%S.000000Z')}",
+            str(output_path),
+        ],
+        check=True,
+    )
+
+
+def generate_card_clips(clips_root: Path, clips_per_camera: int, seconds: float) -> None:
+    """
+    Generates one ride per camera, named the way each camera names its files.
+
+    DJI clips go under ``DCIM/DJI_001`` as ``DJI_<datetime>_<n>_D.MP4`` with an
+    ``.LRF`` proxy each; FLY6PRO clips are named by their start time.
+    """
+    for i in range(clips_per_camera):
+        start = RIDE_START + timedelta(seconds=i * seconds)
+        local = start.astimezone(timezone(timedelta(hours=8)))
+
+        dji_clip = (
+            clips_root
+            / "DJI_ACTION4"
+            / "DCIM"
+            / "DJI_001"
+            / f"DJI_{local:%Y%m%d%H%M%S}_{i + 1:04d}_D.MP4"
+        )
+        generate_clip(dji_clip, start, seconds)
+        dji_clip.with_suffix(".LRF").write_bytes(b"\0" * 4096)
+
+        fly6_clip = clips_root / "FLY6PRO" / "DCIM" / "100FLY6P" / f"{local:%Y%m%d%H%M%S}.MP4"
+        generate_clip(fly6_clip, start, seconds, size="1280x720")
+
+
+class FakeYouTubeHandler(http.server.BaseHTTPRequestHandler):
+    """Minimal resumable-upload endpoint that discards data and counts bytes."""
+
+    protocol_version = "HTTP/1.1"
+    sessions: dict[str, int] = {}
+    uplink_bytes_per_s: Optional[float] = None
+    lock = threading.Lock()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, headers: dict[str, str] = {}, body: bytes = b"") -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            session_id = str(len(self.sessions))
+            self.sessions[session_id] = 0
+        host, port = self.server.server_address[:2]
+        self._reply(200, {"Location": f"http://{host}:{port}/session/{session_id}"})
+
+    def do_PUT(self) -> None:
+        session_id = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.uplink_bytes_per_s:
+            time.sleep(len(body) / self.uplink_bytes_per_s)
+
+        content_range = self.headers.get("Content-Range", "")
+        match = re.match(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", content_range)
+        with self.lock:
+            received = self.sessions[session_id]
+            if match and match[1] is not None and int(match[1]) == received:
+                received += len(body)
+                self.sessions[session_id] = received
+
+        total = match[2] if match else "*"
+        if total != "*" and received == int(total):
+            body = json.dumps({"id": f"fake-{session_id}"}).encode()
+            self._reply(200, {"Content-Type": "application/json"}, body)
+        elif received:
+            self._reply(308, {"Range": f"bytes=0-{received - 1}"})
+        else:
+            self._reply(308)
+
+
+def start_fake_youtube(uplink_mb_per_s: Optional[float] = None) -> http.server.HTTPServer:
+    """Serves the fake endpoint on a free local port from a background thread."""
+    FakeYouTubeHandler.sessions = {}
+    FakeYouTubeHandler.uplink_bytes_per_s = uplink_mb_per_s * 1e6 if uplink_mb_per_s else None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeYouTubeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def folder_size(folder: Path, pattern: str = "*.mp4") -> int:
+    return sum(f.stat().st_size for f in folder.rglob(pattern) if f.is_file())
+
+
+def stage_result(seconds: float, nbytes: int) -> dict[str, float]:
+    return {
+        "seconds": round(seconds, 3),
+        "bytes": nbytes,
+        "mb_per_s": round(nbytes / 1e6 / seconds, 2) if seconds else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_mux_modes(clip_folder: Path, work_dir: Path) -> dict[str, dict[str, Any]]:
+    """
+    Combines the same clips once per MP4 layout, plus the old +faststart layout.
+
+    Records the bytes FFmpeg wrote against the size of the output (Linux
+    only; elsewhere ``bytes_written`` is None).
+    """
+    input_files = list_clips(clip_folder, ".mp4")
+    work_dir.mkdir(parents=True, exist_ok=True)
+    concat_list = work_dir / "concat.txt"
+    write_concat_list(concat_list, input_files)
+
+    layouts = {"faststart": FASTSTART_ARGS}
+    layouts.update((mode, mux_args(mode, input_files)) for mode in get_args(MuxMode))
+    results = {}
+    for name, movflags_args in layouts.items():
+        output_path = work_dir / f"{name}.mp4"
+        start = time.perf_counter()
+        written = run_concat(concat_list, output_path, movflags_args, FFmpegMonitor())
+        size = output_path.stat().st_size
+        results[name] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "output_bytes": size,
+            "bytes_written": written,
+            "write_amplification": round(written / size, 3) if written is not None else None,
+        }
+        output_path.unlink()
+    concat_list.unlink()
+    return results
+
+
+def use_benchmark_folders(work_dir: Path, upload_url: str, nas_backup: bool = False) -> None:
+    """
+    Points the pipeline's folders, caches and backup destinations at the benchmark tree.
+
+    Videos go to the fake YouTube endpoint and, with ``nas_backup``, also to
+    a folder standing in for the NAS, fed from the same read.
+    """
+    pipeline.INPUT_VIDEO_FOLDER_PATH = work_dir / "Input"
+    pipeline.OUTPUT_VIDEO_FOLDER_PATH = work_dir / "Output"
+    pipeline.ARCHIVE_VIDEO_FOLDER_PATH = work_dir / "Archive"
+    pipeline.UPLOADED_VIDEO_FOLDER_PATH = work_dir / "Uploaded"
+    for folder in ("Input", "Output", "Archive", "Uploaded"):
+        (work_dir / folder).mkdir(parents=True, exist_ok=True)
+
+    # Cold caches every run, kept out of the real project cache
+    probe_cache._default_cache = probe_cache.ProbeCache(work_dir / "probe_cache.json")
+    upload_queue._default_queue = UploadQueue(work_dir / "upload_queue.sqlite3")
+    session = requests.Session()
+
+    def backup_sinks(
+        title: str,
+        description: str,
+        tags: list[str],
+        category_id: int,
+        privacy_status: str,
+        upload_scheduler: UploadScheduler,
+    ) -> list[BackupSink]:
+        request_body = build_request_body(title, description, tags, category_id, privacy_status)
+        sinks: list[BackupSink] = [
+            YouTubeSink(request_body, upload_url, session, upload_scheduler.throttle)
+        ]
+        if nas_backup:
+            sinks.append(FilesystemSink(work_dir / "NAS"))
+        return sinks
+
+    pipeline.backup_sinks = backup_sinks
+
+
+def run_benchmark(
+    work_dir: Path,
+    card_root: Optional[Path] = None,
+    clips_per_camera: int = 3,
+    clip_seconds: float = 10.0,
+    uplink_mb_per_s: Optional[float] = None,
+    nas_backup: bool = False,
+) -> dict[str, Any]:
+    """
+    Runs the pipeline once over freshly laid out fake cards.
+
+    Args:
+        work_dir: Scratch folder for the Input/Output/Archive/Uploaded tree
+        card_root: Where the fake cards are mounted; put it on another
+            filesystem (e.g. /dev/shm) to exercise the cross-device copy path
+        clips_per_camera: Number of clips per camera
+        clip_seconds: Length of each clip
+        uplink_mb_per_s: Simulated upload bandwidth, None for unlimited
+        nas_backup: Also back up to a local folder standing in for the NAS
+
+    Returns:
+        JSON-serialisable results
+    """
+    clips_root = BENCHMARK_ROOT / f"clips_{clips_per_camera}x{clip_seconds:g}s"
+    if not clips_root.exists():
+        logging.info(f"Generating synthetic clips in {clips_root}")
+        # Generated aside and renamed, so an interrupted run never leaves a partial set
+        partial = clips_root.with_name(clips_root.name + ".partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        generate_card_clips(partial, clips_per_camera, clip_seconds)
+        partial.rename(clips_root)
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    card_root = card_root or work_dir / "cards"
+    shutil.rmtree(card_root, ignore_errors=True)
+    shutil.copytree(clips_root, card_root)
+
+    server = start_fake_youtube(uplink_mb_per_s)
+    upload_url = f"http://127.0.0.1:{server.server_address[1]}/upload"
+    use_benchmark_folders(work_dir, upload_url, nas_backup)
+    stages: dict[str, dict[str, float]] = {}
+    total_start = time.perf_counter()
+
+    card_bytes = folder_size(card_root, "*.MP4")
+    start = time.perf_counter()
+    index = IngestIndex(work_dir / "ingest_index.sqlite3")
+    cameras = [card.name for card in card_root.iterdir() if card.is_dir()]
+
+    async def ingest() -> None:
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    move_all_files_in_folder,
+                    card_root / camera,
+                    pipeline.INPUT_VIDEO_FOLDER_PATH / camera,
+                    index=index,
+                )
+                for camera in cameras
+            )
+        )
+
+    asyncio.run(ingest())
+    stages["ingest"] = stage_result(time.perf_counter() - start, card_bytes)
+
+    start = time.perf_counter()
+    results = [
+        pipeline.process_folder(pipeline.INPUT_VIDEO_FOLDER_PATH / camera) for camera in cameras
+    ]
+    results = [result for result in results if result]
+    combined_bytes = sum(result[0].stat().st_size for result in results)
+    stages["combine"] = stage_result(time.perf_counter() - start, combined_bytes)
+
+    start = time.perf_counter()
+    scheduler = UploadScheduler(pipeline.MAX_CONCURRENT_UPLOADS)
+
+    async def upload() -> list[bool]:
+        return await asyncio.gather(
+            *(
+                pipeline.upload_and_move(
+                    output_file_path, output_filename, video_datetime, [], 17, "private", 3, scheduler
+                )
+                for output_file_path, output_filename, video_datetime in results
+            )
+        )
+
+    uploaded = asyncio.run(upload())
+    stages["upload"] = stage_result(time.perf_counter() - start, scheduler.bytes_sent)
+    server.shutdown()
+    total_seconds = time.perf_counter() - total_start
+
+    # Measured apart from the pipeline stages, on a pristine copy of the clips
+    mux_modes = measure_mux_modes(
+        clips_root / "DJI_ACTION4" / "DCIM" / "DJI_001", work_dir / "mux_modes"
+    )
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "clips_per_camera": clips_per_camera,
+            "clip_seconds": clip_seconds,
+            "uplink_mb_per_s": uplink_mb_per_s,
+            "nas_backup": nas_backup,
+            "cross_device": card_root.stat().st_dev != work_dir.stat().st_dev,
+        },
+        "uploads_ok": sum(uploaded),
+        "uploads": len(uploaded),
+        "stages": stages,
+        "mux_modes": mux_modes,
+        "total_seconds": round(total_seconds, 3),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Offline ingest -> combine -> upload benchmark on synthetic camera "
+        "cards and a local fake of the YouTube upload endpoint; prints JSON results"
+    )
+    parser.add_argument("--work-dir", type=Path, default=BENCHMARK_ROOT / "run")
+    parser.add_argument("--card-root", type=Path, help="Fake card mount, ideally another filesystem")
+    parser.add_argument("--clips", type=int, default=3, help="Clips per camera")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Length of each clip")
+    parser.add_argument("--uplink", type=float, help="Simulated uplink in MB/s")
+    parser.add_argument(
+        "--nas", action="store_true", help="Also back up to a local NAS stand-in folder"
+    )
+    parser.add_argument("-o", "--output", type=Path, help="Append results to this JSON lines file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_benchmark(
+        args.work_dir, args.card_root, args.clips, args.seconds, args.uplink, args.nas
+    )
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with args.output.open("a") as f:
+            f.write(json.dumps(results) + "\n")
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+SYSFS_BLOCK_DIR = Path("/sys/dev/block")
+# A spinning disk slows down with every extra concurrent stream; SSDs do not
+HDD_JOBS_PER_DEVICE = 1
+SSD_JOBS_PER_DEVICE = 4
+# Used where the device type cannot be read, e.g. on Windows
+UNKNOWN_JOBS_PER_DEVICE = 1
+
+
+def device_of(path: Path) -> int:
+    """Returns the device ID of the filesystem holding a path, which need not exist yet."""
+    path = Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return path.stat().st_dev
+
+
+def is_rotational(path: Path) -> Optional[bool]:
+    """
+    Returns whether a path lives on a spinning disk, or None if unknown.
+
+    Reads ``queue/rotational`` for the block device behind the path's
+    filesystem from sysfs; partitions keep it on their parent disk. Where
+    there is no sysfs (e.g. Windows, macOS) the type is unknown.
+    """
+    if not hasattr(os, "major") or not SYSFS_BLOCK_DIR.is_dir():
+        return None
+    device = device_of(path)
+    block_dir = SYSFS_BLOCK_DIR / f"{os.major(device)}:{os.minor(device)}"
+    for queue_dir in (block_dir / "queue", block_dir / ".." / "queue"):
+        try:
+            return (queue_dir / "rotational").read_text().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def jobs_per_device(path: Path) -> int:
+    """Returns how many I/O-heavy jobs may run at once on the device holding a path."""
+    rotational = is_rotational(path)
+    if rotational is None:
+        return UNKNOWN_JOBS_PER_DEVICE
+    return HDD_JOBS_PER_DEVICE if rotational else SSD_JOBS_PER_DEVICE
+
+
+class DeviceLimiter:
+    """
+    Caps concurrent I/O-heavy jobs per block device.
+
+    A job names every path it reads or writes and holds a slot on each of
+    their devices, so two combines on one HDD run one after the other while
+    jobs on different devices run fully in parallel.
+    """
+
+    def __init__(self, max_jobs: Optional[int] = None):
+        self._global = asyncio.Semaphore(max_jobs) if max_jobs else None
+        self._devices: dict[int, asyncio.Semaphore] = {}
+
+    def _semaphore(self, device: int, path: Path) -> asyncio.Semaphore:
+        if device not in self._devices:
+            limit = jobs_per_device(path)
+            logging.info(f"Device {device} ({path}): up to {limit} concurrent jobs")
+            self._devices[device] = asyncio.Semaphore(limit)
+        return self._devices[device]
+
+    @asynccontextmanager
+    async def slot(self, *paths: Path) -> AsyncIterator[None]:
+        """Waits until every device touched by a job has a free slot."""
+        devices = {device_of(Path(path)): Path(path) for path in paths}
+        async with AsyncExitStack() as stack:
+            if self._global:
+                await stack.enter_async_context(self._global)
+            # Always acquired in device order, so two jobs cannot deadlock
+            for device in sorted(devices):
+                await stack.enter_async_context(self._semaphore(device, devices[device]))
+            yield
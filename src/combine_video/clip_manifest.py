@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import subprocess
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterable, List, Optional
+
+from fingerprint import partial_hash
+from get_video_recording_time import get_video_recording_time
+from media_info import probe_media
+
+MANIFEST_SUFFIX = ".manifest.json"
+# Recording times in output names and manifests, as produced by get_video_recording_time
+RECORDING_TIME_FORMAT = "%Y%m%d_%H%M%S"
+# A clip starting within this long after a ride's last clip continues that ride
+RIDE_GAP = timedelta(minutes=10)
+
+
+def manifest_path_for(video_path: Path) -> Path:
+    """Returns the sidecar manifest path of a combined video."""
+    return video_path.with_suffix(MANIFEST_SUFFIX)
+
+
+def clip_end_time(clip: Path) -> Optional[str]:
+    """Returns when a clip stopped recording, or None if its recording time is unknown."""
+    try:
+        start = datetime.strptime(get_video_recording_time(clip), RECORDING_TIME_FORMAT)
+        end = start + timedelta(seconds=probe_media(clip).duration)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        logging.warning(f"No recording end time for {clip.name}: {e}")
+        return None
+    return end.strftime(RECORDING_TIME_FORMAT)
+
+
+def clip_record(clip: Path) -> dict[str, Any]:
+    """Describes a source clip by name, size, partial content hash and recording end."""
+    return {
+        "name": clip.name,
+        "size": clip.stat().st_size,
+        "hash": partial_hash(clip),
+        "end": clip_end_time(clip),
+    }
+
+
+def load_manifest(manifest_file: Path) -> dict[str, Any]:
+    """Loads a manifest written by write_manifest."""
+    return json.loads(manifest_file.read_text())
+
+
+def save_manifest(manifest_file: Path, manifest: dict[str, Any]) -> None:
+    """Atomically writes a manifest next to its video."""
+    tmp_file = manifest_file.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_file, manifest_file)
+
+
+def write_manifest(output_file_path: Path, clips: Iterable[Path]) -> None:
+    """Writes a fresh manifest for a combined video and the clips it was built from."""
+    manifest = {
+        "output": output_file_path.name,
+        "segments": [
+            {"file": output_file_path.name, "clips": [clip_record(c) for c in clips]}
+        ],
+    }
+    save_manifest(manifest_path_for(output_file_path), manifest)
+    logging.info(f"Manifest written for {output_file_path}")
+
+
+def add_segment(manifest_file: Path, segment_path: Path, clips: Iterable[Path]) -> None:
+    """Records an appended segment and its source clips in an existing manifest."""
+    manifest = load_manifest(manifest_file)
+    manifest["segments"].append(
+        {"file": segment_path.name, "clips": [clip_record(c) for c in clips]}
+    )
+    save_manifest(manifest_file, manifest)
+    logging.info(f"Segment {segment_path.name} added to {manifest_file}")
+
+
+def new_clips(manifest: dict[str, Any], clips: List[Path]) -> List[Path]:
+    """Returns the clips that are not already part of any segment of a manifest."""
+    known = {
+        (record["name"], record["size"], record["hash"])
+        for segment in manifest["segments"]
+        for record in segment["clips"]
+    }
+    return [
+        clip
+        for clip in clips
+        if (clip.name, clip.stat().st_size, partial_hash(clip)) not in known
+    ]
+
+
+def ride_end_time(manifest: dict[str, Any]) -> Optional[datetime]:
+    """Returns when the last clip of a manifest stopped recording, if recorded."""
+    ends = [
+        datetime.strptime(record["end"], RECORDING_TIME_FORMAT)
+        for segment in manifest["segments"]
+        for record in segment["clips"]
+        if record.get("end")
+    ]
+    return max(ends, default=None)
+
+
+def find_ride_manifest(
+    search_folders: Iterable[Path],
+    video_datetime: str,
+    source_name: str,
+    max_gap: timedelta = RIDE_GAP,
+) -> Optional[Path]:
+    """
+    Finds the manifest of an earlier combined video of the same ride.
+
+    Outputs are named ``<datetime>_<folder>``, so candidates are the videos of
+    the same camera folder that started on the same or the previous day. Clips
+    continue a ride if that ride started at the same time, or if they start no
+    later than ``max_gap`` after its last clip ended; a second ride on the same
+    day gets its own video. Manifests written before clip end times were
+    recorded only match on the exact start time.
+    """
+    start = datetime.strptime(video_datetime, RECORDING_TIME_FORMAT)
+    days = {start.strftime("%Y%m%d"), (start - timedelta(days=1)).strftime("%Y%m%d")}
+
+    best: Optional[tuple[datetime, Path]] = None
+    for folder in search_folders:
+        if not folder.is_dir():
+            continue
+        for day in days:
+            for manifest_file in folder.glob(f"{day}_*_{source_name}{MANIFEST_SUFFIX}"):
+                try:
+                    ride_start = datetime.strptime(
+                        manifest_file.name[: len(video_datetime)], RECORDING_TIME_FORMAT
+                    )
+                except ValueError:
+                    continue
+                if ride_start > start or (best and ride_start <= best[0]):
+                    continue
+                if ride_start != start:
+                    ride_end = ride_end_time(load_manifest(manifest_file))
+                    if ride_end is None or start > ride_end + max_gap:
+                        continue
+                best = (ride_start, manifest_file)
+    return best[1] if best else None
@@ -1,14 +1,53 @@
 import logging
+import os
 import subprocess
-import re
 from pathlib import Path
-from typing import List
-from tqdm import tqdm
+from typing import Iterator, List, Literal, Optional
+
+from clip_manifest import (
+    add_segment,
+    load_manifest,
+    manifest_path_for,
+    new_clips,
+    write_manifest,
+)
+
+from ffmpeg_progress import (
+    PROGRESS_ARGS,
+    FFmpegMonitor,
+    LoggingSink,
+    ProgressSink,
+    TqdmSink,
+    wait_counting_writes,
+)
+from media_info import MAX_PROBE_WORKERS, probe_media, probe_media_many
+from mp4_boxes import MP4_SUFFIXES, InvalidMP4Error, moov_size
+from repair_clip import (
+    PARTIAL_SUFFIX,
+    find_reference_clip,
+    repair_truncated_clip,
+    restore_truncated_clips,
+)
+
+# Size of each read from the FFmpeg pipe in streaming mode
+STREAM_READ_SIZE = 1024 * 1024
+
+# MP4 layout of a combined video, chosen by where it is going. "+faststart" makes
+# FFmpeg rewrite the whole output a second time to move moov to the front, so:
+#   upload   - fragmented MP4 in one pass; YouTube does not need moov first
+#   archive  - moov at the end, in one pass
+#   playback - moov first for instant seeking, into space reserved up front
+MuxMode = Literal["upload", "archive", "playback"]
+FRAGMENTED_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+FASTSTART_ARGS = ["-movflags", "+faststart"]
+# Headroom over the clips' summed moov sizes, e.g. for 64-bit chunk offsets past 4 GB
+MOOV_RESERVE_FACTOR = 1.25
+MOOV_RESERVE_PADDING = 64 * 1024
 
 
 def get_duration(file_path: Path) -> float:
     """
-    Returns the duration of a video file using FFprobe.
+    Returns the duration of a video file using the shared MediaInfo probe.
 
     Args:
         file_path: Path to the video file
@@ -19,41 +58,193 @@ def get_duration(file_path: Path) -> float:
     Raises:
         subprocess.CalledProcessError: If FFprobe command fails
     """
-    result = subprocess.run(
-        [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=noprint_wrappers=1:nokey=1",
-            str(file_path),
-        ],
-        capture_output=True,
-        text=True,
-        check=True,
+    return probe_media(file_path).duration
+
+
+def probe_durations(
+    files: List[Path], max_workers: int = MAX_PROBE_WORKERS
+) -> tuple[dict[Path, float], List[Path]]:
+    """
+    Returns the durations of many video files, probing uncached files concurrently.
+
+    Args:
+        files: Paths to the video files
+        max_workers: Maximum number of concurrent FFprobe processes
+
+    Returns:
+        Tuple of a mapping from file to duration in seconds, and the list of
+        files that could not be probed
+    """
+    infos, invalid_files = probe_media_many(files, max_workers=max_workers)
+    return {file: info.duration for file, info in infos.items()}, invalid_files
+
+
+def list_clips(input_folder: Path, file_type: str) -> List[Path]:
+    """
+    Lists the clips of a type (lower-case, with leading dot) in a folder, sorted by name.
+
+    Clips left renamed by an interrupted repair are restored first.
+    """
+    restore_truncated_clips(input_folder)
+    return sorted(
+        [file for file in input_folder.iterdir() if file.suffix.lower() == file_type],
+        key=lambda f: f.name.lower(),
     )
-    return float(result.stdout.strip())
 
 
-def parse_time(time_str: str) -> float:
+def repair_invalid_clips(invalid_files: List[Path], healthy: List[Path]) -> List[Path]:
+    """
+    Repairs the clips that failed to probe, using their healthy siblings as references.
+
+    Returns:
+        The clips that were repaired in place
+    """
+    repaired = []
+    for file in invalid_files:
+        reference = find_reference_clip(file, healthy)
+        if file.suffix.lower() not in MP4_SUFFIXES or reference is None:
+            continue
+        try:
+            repair_truncated_clip(file, reference)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            logging.warning(f"Cannot repair {file.name}: {e}")
+            continue
+        repaired.append(file)
+    return repaired
+
+
+def collect_clips(
+    input_folder: Path, file_type: str, clips: Optional[List[Path]] = None
+) -> tuple[List[Path], float]:
     """
-    Converts FFmpeg time string (hh:mm:ss.ms) to seconds.
+    Lists the valid clips of a type in a folder, sorted by name.
+
+    A clip that fails to probe, typically the last one of a ride cut off by a
+    flat battery, is repaired from a healthy sibling before being given up on.
 
     Args:
-        time_str: Time string in FFmpeg format
+        input_folder: Path to the folder containing the source clips
+        file_type: Lower-case file extension including the leading dot
+        clips: Restrict to these clips instead of every clip in the folder
 
     Returns:
-        Total time in seconds as a float
+        Tuple of the valid clip paths and their total duration in seconds
+
+    Raises:
+        ValueError: If no (valid) matching files are found in the input folder
     """
-    hours, minutes, seconds = map(float, time_str.split(":"))
-    return hours * 3600 + minutes * 60 + seconds
+    input_files = list_clips(input_folder, file_type)
+    if clips is not None:
+        input_files = [file for file in input_files if file in clips]
+
+    if not input_files:
+        raise ValueError(f"No {file_type} files found in {input_folder}")
+
+    # Calculate total duration of all input files
+    durations, invalid_files = probe_durations(input_files)
+
+    if invalid_files:
+        logging.warning(f"Invalid files found: {invalid_files}")
+        repaired = repair_invalid_clips(invalid_files, list(durations))
+        repaired_durations, still_invalid = probe_durations(repaired)
+        durations.update(repaired_durations)
+        invalid_files = [file for file in invalid_files if file not in repaired] + still_invalid
+    total_duration = sum(durations.values())
+    # Remove invalid files from list
+    input_files = [file for file in input_files if file not in invalid_files]
+
+    if not input_files:
+        raise ValueError(f"No valid {file_type} files found in {input_folder}")
+
+    return input_files, total_duration
+
+
+def write_concat_list(concat_list: Path, input_files: List[Path]) -> None:
+    """Writes an FFmpeg concat demuxer list for the given clips."""
+    with concat_list.open("w") as f:
+        for file in input_files:
+            f.write(f"file '{file.resolve()}'\n")
+
+
+def mux_args(mode: MuxMode, input_files: List[Path]) -> List[str]:
+    """
+    Returns the FFmpeg muxer arguments that lay out a combined video for its destination.
+
+    For playback, the space reserved for ``moov`` is estimated from the
+    clips' own ``moov`` boxes, whose sample tables the combined one
+    concatenates. If a clip cannot be read, ``+faststart`` is used instead.
+    """
+    if mode == "upload":
+        return ["-movflags", FRAGMENTED_MOVFLAGS]
+    if mode == "archive":
+        return []
+    if mode == "playback":
+        try:
+            estimate = sum(moov_size(file) for file in input_files)
+        except (OSError, InvalidMP4Error) as e:
+            logging.warning(f"Cannot size the moov reservation, using +faststart: {e}")
+            return FASTSTART_ARGS
+        return ["-moov_size", str(int(estimate * MOOV_RESERVE_FACTOR) + MOOV_RESERVE_PADDING)]
+    raise ValueError(f"Unknown mux mode: {mode}")
+
+
+def run_concat(
+    concat_list: Path,
+    output_file_path: Path,
+    movflags_args: List[str],
+    monitor: FFmpegMonitor,
+) -> Optional[int]:
+    """
+    Stream-copies the clips of a concat list into one file.
+
+    Returns:
+        Bytes FFmpeg wrote in total, or None where this cannot be measured
+
+    Raises:
+        subprocess.CalledProcessError: If FFmpeg command fails
+    """
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            *PROGRESS_ARGS,
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            str(concat_list),
+            "-c",
+            "copy",
+            *movflags_args,
+            "-y",
+            str(output_file_path),
+        ],
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        text=True,
+        bufsize=1,
+        encoding="utf-8",
+        errors="replace",
+    )
+
+    monitor.consume(process.stderr)
+    bytes_written = wait_counting_writes(process)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=monitor.error_output()
+        )
+    return bytes_written
 
 
 def combine_clips(
-    input_folder: Path, output_file_path: Path, file_type: str = ".mp4"
-) -> None:
+    input_folder: Path,
+    output_file_path: Path,
+    file_type: str = ".mp4",
+    clips: Optional[List[Path]] = None,
+    progress_sinks: Optional[List[ProgressSink]] = None,
+    mode: MuxMode = "playback",
+) -> List[Path]:
     """
     Combines video clips of a specific type into a single output file using FFmpeg with a progress bar.
 
@@ -61,6 +252,12 @@ def combine_clips(
         input_folder: Path to the folder containing the source clips
         output_file_path: Path to the destination video file (extension will be forced to match file_type)
         file_type: File extension to process (case-insensitive), must include leading dot
+        clips: Restrict to these clips instead of every clip in the folder
+        progress_sinks: Extra receivers of FFmpeg progress snapshots, besides the progress bar and log
+        mode: Where the video is going, which decides its MP4 layout (see MuxMode)
+
+    Returns:
+        The clips that went into the output, in order
 
     Raises:
         ValueError: If no matching files are found in the input folder
@@ -78,95 +275,52 @@ def combine_clips(
     output_file_path.parent.mkdir(parents=True, exist_ok=True)
     output_file_path = output_file_path.with_suffix(file_type)
 
-    input_files: List[Path] = sorted(
-        [file for file in input_folder.iterdir() if file.suffix.lower() == file_type],
-        key=lambda f: f.name.lower(),
-    )
-
-    if not input_files:
-        raise ValueError(f"No {file_type} files found in {input_folder}")
-
-    # Calculate total duration of all input files
-    total_duration = 0.0
-    invalid_files = []
-    for file in input_files:
-        try:
-            total_duration += get_duration(file)
-        except ValueError as e:
-            logging.error(f"Error getting duration for {file}: {e}")
-            invalid_files.append(file)
-
-    if invalid_files:
-        logging.warning(f"Invalid files found: {invalid_files}")
-    # Remove invalid files from list
-    input_files = [file for file in input_files if file not in invalid_files]
-
-    if not input_files:
-        raise ValueError(f"No valid {file_type} files found in {input_folder}")
+    input_files, total_duration = collect_clips(input_folder, file_type, clips)
 
     concat_list = input_folder / (output_file_path.stem + "concat.txt")
     progress_bar = None
 
     try:
-        with concat_list.open("w") as f:
-            for file in input_files:
-                f.write(f"file '{file.resolve()}'\n")
+        write_concat_list(concat_list, input_files)
 
         logging.info(f"Concat list created: {concat_list}")
         logging.info(f"Running FFmpeg command for {output_file_path}")
 
         # Initialize progress bar
-        progress_bar = tqdm(
-            total=round(total_duration, 2),
-            unit="s",
-            desc="Combining clips",
-            bar_format="{l_bar}{bar}| {n:.2f}/{total:.2f}s [{elapsed}<{remaining}, {rate_fmt}{postfix}]",
+        progress_bar = TqdmSink("Combining clips", total_duration)
+        monitor = FFmpegMonitor(
+            total_duration,
+            [progress_bar, LoggingSink(f"Combining {output_file_path.name}")]
+            + (progress_sinks or []),
         )
-        # Run FFmpeg process
-        process = subprocess.Popen(
-            [
-                "ffmpeg",
-                "-f",
-                "concat",
-                "-safe",
-                "0",
-                "-i",
-                str(concat_list),
-                "-c",
-                "copy",
-                "-movflags",
-                "+faststart",
-                "-y",
-                str(output_file_path),
-            ],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.DEVNULL,
-            text=True,
-            bufsize=1,
-            encoding="utf-8",
-            errors="replace",
-        )
-
-        stderr_lines = []
-        for line in process.stderr:
-            line = line.strip()
-            stderr_lines.append(line)
-
-            # Update progress from time markers
-            time_match = re.search(r"time=(\d+:\d+:\d+\.\d+)", line)
-            if time_match:
-                current_time = parse_time(time_match.group(1))
-                progress_bar.update(round(current_time - progress_bar.n, 2))
-
-        process.wait()
+        try:
+            bytes_written = run_concat(
+                concat_list, output_file_path, mux_args(mode, input_files), monitor
+            )
+        except subprocess.CalledProcessError as e:
+            if "reserved_moov_size is too small" not in (e.stderr or ""):
+                raise
+            logging.warning(
+                f"moov reservation too small for {output_file_path.name}, using +faststart"
+            )
+            bytes_written = run_concat(
+                concat_list,
+                output_file_path,
+                FASTSTART_ARGS,
+                FFmpegMonitor(total_duration, [LoggingSink(f"Combining {output_file_path.name}")]),
+            )
         progress_bar.close()
 
-        if process.returncode != 0:
-            error_output = "\n".join(stderr_lines)
-            raise subprocess.CalledProcessError(
-                process.returncode, process.args, stderr=error_output
+        if bytes_written is not None:
+            output_size = output_file_path.stat().st_size
+            logging.info(
+                f"{output_file_path.name} ({mode}): wrote {bytes_written / 1e6:.1f} MB "
+                f"for {output_size / 1e6:.1f} MB of output, "
+                f"write amplification {bytes_written / max(output_size, 1):.2f}x"
             )
 
+        return input_files
+
     except subprocess.CalledProcessError as e:
         print(f"FFmpeg command failed with exit code {e.returncode}")
         print(f"Error output:\n{e.stderr}")
@@ -177,6 +331,174 @@ def combine_clips(
         concat_list.unlink(missing_ok=True)
 
 
+def _combine_or_discard(
+    input_folder: Path,
+    output_file_path: Path,
+    file_type: str,
+    clips: Optional[List[Path]] = None,
+    mode: MuxMode = "playback",
+) -> List[Path]:
+    """Runs combine_clips, removing the partial output if FFmpeg fails."""
+    try:
+        return combine_clips(input_folder, output_file_path, file_type, clips, mode=mode)
+    except subprocess.CalledProcessError:
+        output_file_path.unlink(missing_ok=True)
+        raise
+
+
+def combine_clips_incremental(
+    input_folder: Path,
+    output_file_path: Path,
+    manifest_file: Optional[Path] = None,
+    file_type: str = ".mp4",
+    mode: MuxMode = "playback",
+) -> Optional[Path]:
+    """
+    Combines clips, appending only clips missing from the manifest as a new segment.
+
+    The first run combines every clip into ``output_file_path`` and writes its
+    sidecar manifest. Later runs for the same ride stream-copy only the clips
+    that are not yet in the manifest into a ``_partNN`` segment next to the
+    output, instead of re-muxing the whole ride.
+
+    Args:
+        input_folder: Path to the folder containing the source clips
+        output_file_path: Path to the combined video for a first run
+        manifest_file: Manifest of an earlier combined video of this ride, if any
+        file_type: File extension to process (case-insensitive), must include leading dot
+        mode: Where the video is going, which decides its MP4 layout (see MuxMode)
+
+    Returns:
+        Path of the newly written video or segment, or None if there was nothing new
+
+    Raises:
+        ValueError: If no matching files are found in the input folder
+        subprocess.CalledProcessError: If FFmpeg command fails
+    """
+    file_type = file_type.lower()
+    manifest_file = manifest_file or manifest_path_for(output_file_path)
+
+    if not manifest_file.exists():
+        if output_file_path.exists():
+            logging.warning(
+                f"{output_file_path} has no clip manifest, continuing with existing video."
+            )
+            return None
+        combined = _combine_or_discard(input_folder, output_file_path, file_type, mode=mode)
+        write_manifest(output_file_path, combined)
+        return output_file_path
+
+    manifest = load_manifest(manifest_file)
+    pending = new_clips(manifest, list_clips(input_folder, file_type))
+    if not pending:
+        logging.info(f"All clips in {input_folder} are already in {manifest_file.name}")
+        return None
+
+    base_stem = Path(manifest["output"]).stem
+    segment_path = output_file_path.parent / (
+        f"{base_stem}_part{len(manifest['segments']) + 1:02d}{file_type}"
+    )
+    logging.info(f"Appending {len(pending)} new clips as {segment_path.name}")
+    combined = _combine_or_discard(input_folder, segment_path, file_type, pending, mode)
+    add_segment(manifest_file, segment_path, combined)
+    return segment_path
+
+
+def stream_combined_clips(
+    input_folder: Path,
+    tee_file_path: Path,
+    file_type: str = ".mp4",
+    read_size: int = STREAM_READ_SIZE,
+) -> Iterator[bytes]:
+    """
+    Combines clips into a fragmented MP4 and yields it as it is produced.
+
+    FFmpeg muxes to a pipe instead of a file, so the output can be uploaded
+    while it is still being written. Every chunk is also written to a
+    ``.partial`` file next to ``tee_file_path`` before it is yielded. The
+    partial file is renamed to ``tee_file_path`` only once FFmpeg exits
+    cleanly and is deleted on any other outcome, so a failed, cancelled or
+    abandoned stream never leaves a truncated video under the final name.
+
+    Args:
+        input_folder: Path to the folder containing the source clips
+        tee_file_path: Local file that receives a copy of the complete stream
+        file_type: File extension to process (case-insensitive), must include leading dot
+        read_size: Size of each read from the FFmpeg pipe
+
+    Yields:
+        Chunks of the combined fragmented MP4
+
+    Raises:
+        ValueError: If no matching files are found in the input folder
+        subprocess.CalledProcessError: If FFmpeg command fails
+        FileExistsError: If the tee file already exists
+    """
+    file_type = file_type.lower()
+    if not file_type.startswith("."):
+        raise ValueError("File type must start with a dot (e.g., .mp4)")
+
+    if tee_file_path.exists():
+        raise FileExistsError(f"Output file already exists: {tee_file_path}")
+    tee_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    partial_path = tee_file_path.with_name(tee_file_path.name + PARTIAL_SUFFIX)
+    input_files, total_duration = collect_clips(input_folder, file_type)
+    concat_list = input_folder / (tee_file_path.stem + "concat.txt")
+    write_concat_list(concat_list, input_files)
+
+    progress_bar = TqdmSink("Streaming clips", total_duration)
+    monitor = FFmpegMonitor(
+        total_duration, [progress_bar, LoggingSink(f"Streaming {tee_file_path.name}")]
+    )
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            *PROGRESS_ARGS,
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            str(concat_list),
+            "-c",
+            "copy",
+            "-movflags",
+            FRAGMENTED_MOVFLAGS,
+            "-f",
+            "mp4",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    # stderr must be drained concurrently or FFmpeg blocks once the pipe fills
+    stderr_thread = monitor.start(process.stderr)
+
+    try:
+        with partial_path.open("wb") as tee_file:
+            while chunk := process.stdout.read(read_size):
+                tee_file.write(chunk)
+                yield chunk
+
+        process.wait()
+        stderr_thread.join()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, process.args, stderr=monitor.error_output()
+            )
+        os.replace(partial_path, tee_file_path)
+        write_manifest(tee_file_path, input_files)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        progress_bar.close()
+        concat_list.unlink(missing_ok=True)
+        partial_path.unlink(missing_ok=True)
+
+
 if __name__ == "__main__":
     input_folder = Path("C:/Video/Input/OA4")
     output_file_path = Path("C:/Video/combined_video")
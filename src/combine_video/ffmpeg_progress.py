@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+from tqdm import tqdm
+
+# Arguments that make FFmpeg report key=value progress blocks on stderr
+PROGRESS_ARGS = ["-nostats", "-progress", "pipe:2", "-loglevel", "warning"]
+# Keys FFmpeg emits in -progress output; anything else on stderr is a log line
+PROGRESS_KEYS = {
+    "frame",
+    "fps",
+    "bitrate",
+    "total_size",
+    "out_time_us",
+    "out_time_ms",
+    "out_time",
+    "dup_frames",
+    "drop_frames",
+    "speed",
+    "progress",
+}
+# Number of non-progress stderr lines kept for error reports
+STDERR_TAIL_LINES = 200
+# Per-process I/O counters (Linux)
+PROC_IO_FILE = "/proc/{pid}/io"
+
+
+@dataclass(slots=True)
+class FFmpegProgress:
+    """A snapshot of an FFmpeg job, built from one -progress block."""
+
+    out_time: float
+    total_size: int
+    speed: Optional[float]
+    elapsed: float
+    total_duration: Optional[float]
+    finished: bool
+
+    @property
+    def mb_per_s(self) -> float:
+        """Output throughput in megabytes per second of wall time."""
+        return self.total_size / 1e6 / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds of wall time left, if the total duration is known."""
+        if not self.total_duration or not self.out_time:
+            return None
+        rate = self.out_time / self.elapsed
+        return max(self.total_duration - self.out_time, 0.0) / rate
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "mb_per_s": self.mb_per_s, "eta": self.eta}
+
+
+ProgressSink = Callable[[FFmpegProgress], None]
+
+
+class LoggingSink:
+    """Logs progress at most every ``interval`` seconds, plus a final summary."""
+
+    def __init__(self, desc: str, interval: float = 30.0):
+        self.desc = desc
+        self.interval = interval
+        self._last_log = 0.0
+
+    def __call__(self, progress: FFmpegProgress) -> None:
+        if not progress.finished and progress.elapsed - self._last_log < self.interval:
+            return
+        self._last_log = progress.elapsed
+        speed = f"{progress.speed:.1f}x" if progress.speed else "n/a"
+        eta = f"{progress.eta:.0f}s" if progress.eta is not None else "n/a"
+        state = "finished" if progress.finished else "running"
+        logging.info(
+            f"{self.desc} {state}: {progress.total_size / 1e6:.1f} MB written, "
+            f"speed {speed}, {progress.mb_per_s:.1f} MB/s, eta {eta}"
+        )
+
+
+class JsonLinesSink:
+    """Appends every progress snapshot to a JSON lines file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __call__(self, progress: FFmpegProgress) -> None:
+        with self.path.open("a") as f:
+            f.write(json.dumps(progress.to_dict()) + "\n")
+
+
+class TqdmSink:
+    """Drives a tqdm bar in seconds of output, with throughput in the postfix."""
+
+    def __init__(self, desc: str, total_duration: float):
+        self.progress_bar = tqdm(
+            total=round(total_duration, 2),
+            unit="s",
+            desc=desc,
+            bar_format="{l_bar}{bar}| {n:.2f}/{total:.2f}s [{elapsed}<{remaining}, {rate_fmt}{postfix}]",
+        )
+
+    def __call__(self, progress: FFmpegProgress) -> None:
+        self.progress_bar.update(round(progress.out_time - self.progress_bar.n, 2))
+        self.progress_bar.set_postfix_str(f"{progress.mb_per_s:.1f} MB/s", refresh=False)
+        if progress.finished:
+            self.close()
+
+    def close(self) -> None:
+        self.progress_bar.close()
+
+
+class FFmpegMonitor:
+    """
+    Parses FFmpeg's stderr into progress snapshots for a set of sinks.
+
+    Expects FFmpeg to have been started with PROGRESS_ARGS. Only the last
+    ``tail_lines`` log lines are retained, so memory stays bounded however
+    long the job runs.
+    """
+
+    def __init__(
+        self,
+        total_duration: Optional[float] = None,
+        sinks: Iterable[ProgressSink] = (),
+        tail_lines: int = STDERR_TAIL_LINES,
+    ):
+        self.total_duration = total_duration
+        self.sinks: List[ProgressSink] = list(sinks)
+        self.stderr_tail: deque[str] = deque(maxlen=tail_lines)
+        self.last: Optional[FFmpegProgress] = None
+        self._start = time.monotonic()
+        self._block: dict[str, str] = {}
+
+    def feed(self, line: str) -> None:
+        """Handles one stderr line."""
+        line = line.strip()
+        key, sep, value = line.partition("=")
+        if not sep or key not in PROGRESS_KEYS:
+            if line:
+                self.stderr_tail.append(line)
+            return
+
+        self._block[key] = value
+        if key == "progress":
+            self._emit(self._block)
+            self._block = {}
+
+    def _emit(self, block: dict[str, str]) -> None:
+        out_time_us = block.get("out_time_us", "N/A")
+        total_size = block.get("total_size", "N/A")
+        speed = block.get("speed", "N/A").rstrip("x")
+        self.last = FFmpegProgress(
+            out_time=int(out_time_us) / 1e6 if out_time_us.lstrip("-").isdigit() else 0.0,
+            total_size=int(total_size) if total_size.isdigit() else 0,
+            speed=float(speed) if speed not in ("N/A", "") else None,
+            elapsed=time.monotonic() - self._start,
+            total_duration=self.total_duration,
+            finished=block["progress"] == "end",
+        )
+        for sink in self.sinks:
+            try:
+                sink(self.last)
+            except Exception as e:
+                logging.warning(f"Progress sink {sink!r} failed: {e}")
+
+    def consume(self, stream: Iterable) -> None:
+        """Reads a text or binary stderr stream until it closes."""
+        for line in stream:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+            self.feed(line)
+
+    def start(self, stream: Iterable) -> threading.Thread:
+        """Consumes a stream on a background thread, e.g. while stdout is being read."""
+        thread = threading.Thread(target=self.consume, args=(stream,), daemon=True)
+        thread.start()
+        return thread
+
+    def error_output(self) -> str:
+        return "\n".join(self.stderr_tail)
+
+
+def wait_counting_writes(process: subprocess.Popen) -> Optional[int]:
+    """
+    Waits for a process and returns how many bytes it wrote, or None if unknown.
+
+    The count is ``wchar`` from the kernel's per-process I/O accounting, read
+    while the exited process is still a zombie, so it covers every write the
+    process made, including FFmpeg's second pass for ``+faststart``. Only
+    available on Linux; elsewhere the process is simply waited for.
+    """
+    written = None
+    if hasattr(os, "waitid"):
+        # WNOWAIT leaves the process unreaped, so its counters can still be read
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        try:
+            with open(PROC_IO_FILE.format(pid=process.pid)) as f:
+                counters = dict(line.split(": ", 1) for line in f if ": " in line)
+            written = int(counters["wchar"])
+        except (OSError, KeyError, ValueError):
+            pass
+    process.wait()
+    return written
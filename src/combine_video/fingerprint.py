@@ -0,0 +1,33 @@
+import hashlib
+from pathlib import Path
+
+# Size of each sampled block; large enough to cover container headers and trailers
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+
+def partial_hash(file_path: Path, block_size: int = FINGERPRINT_BLOCK_SIZE) -> str:
+    """
+    Returns a fingerprint of a file from its size and its head, middle and tail blocks.
+
+    This reads at most three blocks regardless of file size, which is enough
+    to tell camera clips apart without hashing gigabytes of video.
+
+    Args:
+        file_path: Path to the file
+        block_size: Size of each sampled block in bytes
+
+    Returns:
+        Hex digest of the sampled content
+    """
+    size = file_path.stat().st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+
+    with file_path.open("rb") as f:
+        if size <= 3 * block_size:
+            digest.update(f.read())
+        else:
+            for offset in (0, (size - block_size) // 2, size - block_size):
+                f.seek(offset)
+                digest.update(f.read(block_size))
+
+    return digest.hexdigest()
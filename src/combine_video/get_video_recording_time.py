@@ -3,9 +3,10 @@ import re
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import subprocess
-import json
 from typing import List, Optional
 
+from media_info import probe_media
+
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
 
@@ -19,22 +20,9 @@ def get_video_recording_time(video_file: Path) -> str:
     Returns a datetime string in the format "%Y%m%d_%H%M%S" adjusted to UTC+8.
     """
 
-    # First, try to get metadata using ffprobe
+    # First, try to get metadata from the shared ffprobe probe
     try:
-        command = [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format_tags=creation_time",
-            "-of",
-            "json",
-            str(video_file),
-        ]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        metadata = json.loads(result.stdout)
-
-        creation_time = metadata.get("format", {}).get("tags", {}).get("creation_time")
+        creation_time = probe_media(video_file).creation_time
         if creation_time:
             # Parse the creation_time into a datetime object
             try:
@@ -51,7 +39,7 @@ def get_video_recording_time(video_file: Path) -> str:
             logging.info(f"Using metadata creation time (UTC+8) for {video_file.name}: {dt_utc8}")
             return dt_utc8.strftime("%Y%m%d_%H%M%S")
 
-    except (subprocess.CalledProcessError, KeyError, json.JSONDecodeError, ValueError) as e:
+    except (subprocess.CalledProcessError, ValueError) as e:
         logging.warning(f"Metadata extraction failed for {video_file.name}: {e}")
 
     # Fallback: Try to extract datetime from filename
@@ -86,7 +74,8 @@ def get_first_video_file(
 ) -> Path:
     """Get the first video file in the folder sorted by name"""
     for ext in extensions:
-        video_files = sorted(folder.glob(f"*{ext}"))
+        # Compare suffixes case-insensitively, as glob does not on Linux/macOS
+        video_files = sorted(f for f in folder.iterdir() if f.suffix.lower() == ext)
         if video_files:
             return video_files[0]
     raise FileNotFoundError(f"No video files found in folder: {folder}")
@@ -0,0 +1,338 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+try:
+    import xxhash
+except ImportError:  # Optional, hashlib's blake2b is used instead
+    xxhash = None
+
+try:
+    import fcntl
+except ImportError:  # Windows, no reflinks
+    fcntl = None
+
+# Large, reusable copy buffer; SD cards reward big sequential reads
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+# SD card readers rarely go faster with more than a couple of readers in flight
+DEFAULT_INGEST_WORKERS = 2
+JOURNAL_NAME = ".ingest_journal.jsonl"
+PARTIAL_SUFFIX = ".partial"
+# ioctl(dest_fd, FICLONE, src_fd) shares extents on btrfs, XFS and other reflink filesystems
+FICLONE = 0x40049409
+# Errors meaning "not possible here", after which the next strategy is tried
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.EPERM,
+}
+
+
+def new_hasher():
+    """Returns a streaming checksum object, xxh3 if available."""
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+@dataclass(slots=True)
+class IngestResult:
+    """Outcome of ingesting one file."""
+
+    source: Path
+    destination: Path
+    size: int
+    digest: Optional[str]
+    seconds: float
+    method: str
+    source_device: int
+
+
+class IngestJournal:
+    """
+    Append-only record of verified copies, kept in the destination folder.
+
+    If a card dump is interrupted after a file was verified but before its
+    source was deleted, the next run finishes that move without copying again.
+    The journal is removed once a batch moved every file, so it does not
+    outlive the clips it describes.
+    """
+
+    def __init__(self, folder: Path):
+        self.path = folder / JOURNAL_NAME
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn final line from a crash
+                self.entries[entry["source"]] = entry
+
+    def verified_copy(self, source: Path) -> Optional[Path]:
+        """Returns the destination of an already verified copy of source, if still valid."""
+        entry = self.entries.get(str(source))
+        if not entry:
+            return None
+        destination = Path(entry["destination"])
+        try:
+            if (
+                source.stat().st_size == entry["size"]
+                and destination.stat().st_size == entry["size"]
+            ):
+                return destination
+        except FileNotFoundError:
+            pass
+        return None
+
+    def record(self, result: IngestResult) -> None:
+        entry = {
+            "source": str(result.source),
+            "destination": str(result.destination),
+            "size": result.size,
+            "digest": result.digest,
+        }
+        with self._lock:
+            self.entries[entry["source"]] = entry
+            with self.path.open("a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self) -> None:
+        """Deletes the journal once nothing is left to resume."""
+        with self._lock:
+            self.entries.clear()
+            self.path.unlink(missing_ok=True)
+
+
+def _drop_cache(fd: int) -> None:
+    """Asks the OS to evict a file from the page cache so it is re-read from disk."""
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def file_checksum(file_path: Path, buffer_size: int = COPY_BUFFER_SIZE) -> str:
+    """Returns the streaming checksum of a file as read back from disk."""
+    hasher = new_hasher()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with file_path.open("rb", buffering=0) as f:
+        _drop_cache(f.fileno())
+        while n := f.readinto(buffer):
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+
+
+def copy_with_checksum(
+    source: Path, destination: Path, buffer_size: int = COPY_BUFFER_SIZE
+) -> tuple[int, str]:
+    """
+    Copies a file through one reusable buffer while checksumming it.
+
+    Args:
+        source: File to copy
+        destination: Target path; must not exist
+        buffer_size: Size of each read and write
+
+    Returns:
+        Tuple of bytes copied and the checksum of the data read from source
+    """
+    hasher = new_hasher()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    copied = 0
+    with source.open("rb", buffering=0) as fin, destination.open("xb", buffering=0) as fout:
+        while n := fin.readinto(buffer):
+            hasher.update(view[:n])
+            fout.write(view[:n])
+            copied += n
+        fout.flush()
+        os.fsync(fout.fileno())
+    shutil.copystat(source, destination)
+    return copied, hasher.hexdigest()
+
+
+def reflink(source: Path, destination: Path) -> bool:
+    """
+    Clones a file's extents into a new destination without copying data.
+
+    Returns:
+        True on success, False if the filesystems cannot share extents
+    """
+    if fcntl is None:
+        return False
+    partial = destination.with_name(destination.name + PARTIAL_SUFFIX)
+    partial.unlink(missing_ok=True)
+    try:
+        with source.open("rb") as fin, partial.open("xb") as fout:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        shutil.copystat(source, partial)
+        os.replace(partial, destination)
+    except OSError as e:
+        partial.unlink(missing_ok=True)
+        if e.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def rename(source: Path, destination: Path) -> bool:
+    """Renames source to destination; False if the OS refuses, e.g. across mount points."""
+    try:
+        os.rename(source, destination)
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def ingest_file(
+    source: Path,
+    destination: Path,
+    journal: Optional[IngestJournal] = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+) -> IngestResult:
+    """
+    Moves one file, verifying the copy before the source is deleted.
+
+    The cheapest available strategy is used, reported as the result's method:
+    a rename on the same device, a reflink (O(1), e.g. between btrfs
+    subvolumes), and only then a streamed copy. Each strategy falls through
+    to the next when the OS refuses it; bind mounts share a device ID but
+    refuse renames with EXDEV. A hardlink is not tried: it fails with EXDEV
+    wherever a rename was refused or the devices differ. A copy goes to a ``.partial``
+    file with a streaming checksum, is read back and checked, renamed into
+    place, journalled and only then removed from the source.
+
+    Raises:
+        IOError: If the copy does not match the source
+    """
+    start = time.perf_counter()
+    source_device = source.stat().st_dev
+
+    if journal and (previous := journal.verified_copy(source)):
+        source.unlink()
+        logging.info(f"Resumed: '{source.name}' was already verified at '{previous}'")
+        return IngestResult(
+            source, previous, previous.stat().st_size, None, 0.0, "journal", source_device
+        )
+
+    method = None
+    if source_device == destination.parent.stat().st_dev and rename(source, destination):
+        method = "rename"
+    elif reflink(source, destination):
+        method = "reflink"
+    if method:
+        result = IngestResult(
+            source,
+            destination,
+            destination.stat().st_size,
+            None,
+            time.perf_counter() - start,
+            method,
+            source_device,
+        )
+        if method != "rename":
+            if journal:
+                journal.record(result)
+            source.unlink()
+        return result
+
+    partial = destination.with_name(destination.name + PARTIAL_SUFFIX)
+    partial.unlink(missing_ok=True)
+    try:
+        size, digest = copy_with_checksum(source, partial, buffer_size)
+        if file_checksum(partial, buffer_size) != digest:
+            raise IOError(f"Checksum mismatch copying {source} to {destination}")
+        os.replace(partial, destination)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    result = IngestResult(
+        source,
+        destination,
+        size,
+        digest,
+        time.perf_counter() - start,
+        "copy",
+        source_device,
+    )
+    if journal:
+        journal.record(result)
+    source.unlink()
+    return result
+
+
+def ingest_files(
+    pairs: list[tuple[Path, Path]],
+    max_workers: int = DEFAULT_INGEST_WORKERS,
+    journal: Optional[IngestJournal] = None,
+    buffer_size: int = COPY_BUFFER_SIZE,
+) -> list[IngestResult]:
+    """
+    Ingests (source, destination) pairs across a small worker pool.
+
+    Failed files are logged and left at the source; the throughput of each
+    source device is logged at the end.
+    """
+    results: list[IngestResult] = []
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(ingest_file, source, destination, journal, buffer_size): source
+            for source, destination in pairs
+        }
+        for future, source in futures.items():
+            try:
+                result = future.result()
+            except OSError as e:
+                logging.error(f"Failed to ingest {source}: {e}")
+                continue
+            results.append(result)
+            logging.info(
+                f"Moved '{result.source.name}' to '{result.destination}' ({result.method})"
+            )
+
+    elapsed = time.perf_counter() - start
+    log_throughput(results, elapsed)
+    return results
+
+
+def log_throughput(results: list[IngestResult], elapsed: float) -> None:
+    """Logs how many files each strategy moved, and bytes copied and MB/s per source device."""
+    methods: dict[str, int] = {}
+    for result in results:
+        methods[result.method] = methods.get(result.method, 0) + 1
+    if methods:
+        logging.info(
+            "Files moved by " + ", ".join(f"{m}: {n}" for m, n in sorted(methods.items()))
+        )
+
+    per_device: dict[int, list[IngestResult]] = {}
+    for result in results:
+        if result.method == "copy":
+            per_device.setdefault(result.source_device, []).append(result)
+
+    for device, device_results in per_device.items():
+        total_bytes = sum(r.size for r in device_results)
+        mb_per_s = total_bytes / 1e6 / elapsed if elapsed else 0.0
+        logging.info(
+            f"Device {device}: copied {len(device_results)} files, "
+            f"{total_bytes / 1e6:.1f} MB in {elapsed:.1f}s ({mb_per_s:.1f} MB/s)"
+        )
@@ -0,0 +1,99 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from fingerprint import partial_hash
+from probe_cache import CACHE_DIR
+
+INGEST_INDEX_FILE = CACHE_DIR / "ingest_index.sqlite3"
+
+
+class IngestIndex:
+    """
+    Persistent index of every clip ingested from a camera card.
+
+    Clips are keyed by size and partial content hash, so a clip left on a card
+    that was not wiped is recognised from three small reads, whatever it is
+    called and wherever its copy has since been archived.
+    """
+
+    def __init__(self, db_file: Path = INGEST_INDEX_FILE):
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Shared by the per-drive ingest threads, serialised by the lock
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS clips ("
+            " size INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " destination TEXT NOT NULL,"
+            " ingested_at REAL NOT NULL,"
+            " PRIMARY KEY (size, hash))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(file_path: Path) -> tuple[int, str]:
+        """Returns the (size, partial hash) index key of a file."""
+        return file_path.stat().st_size, partial_hash(file_path)
+
+    def lookup(self, key: tuple[int, str]) -> Optional[str]:
+        """Returns where a clip with this key was ingested to, or None if it is new."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT destination FROM clips WHERE size = ? AND hash = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, key: tuple[int, str], source_name: str, destination: Path) -> None:
+        """Marks a clip as ingested."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?, ?)",
+                (*key, source_name, str(destination), time.time()),
+            )
+            self._conn.commit()
+
+    def add_existing(self, folder: Path, extensions: tuple[str, ...] = (".mp4",)) -> int:
+        """Records clips already ingested before the index existed; returns the count."""
+        added = 0
+        for root, _, files in os.walk(folder):
+            for file in files:
+                if file.lower().endswith(extensions):
+                    path = Path(root) / file
+                    key = self.key(path)
+                    if self.lookup(key) is None:
+                        self.record(key, file, path)
+                        added += 1
+        return added
+
+
+_default_index: Optional[IngestIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index() -> IngestIndex:
+    """Returns the process-wide ingest index, opening it on first use."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = IngestIndex()
+        return _default_index
+
+
+if __name__ == "__main__":
+    # Seed the index with clips ingested before it existed
+    logging.basicConfig(level=logging.INFO)
+    folders = [Path(p) for p in sys.argv[1:]] or [
+        Path("C:/Video/Input"),
+        Path("C:/Video/Archive"),
+    ]
+    index = get_default_index()
+    for folder in folders:
+        logging.info(f"Indexed {index.add_existing(folder)} new clips from {folder}")
@@ -1,13 +1,20 @@
 import asyncio
+import contextlib
 import logging
 from datetime import datetime
 from pathlib import Path
 import shutil
-from typing import Literal
+import subprocess
+from typing import Iterable, Literal, Optional
 
-from combine_clips import combine_clips
-from get_video_recording_time import get_first_video_recording_time
-from upload_video import upload_video
+from backup_sinks import BackupSink, FilesystemSink, S3Sink, YouTubeSink, fan_out_upload
+from block_devices import DeviceLimiter
+from clip_manifest import MANIFEST_SUFFIX, find_ride_manifest, manifest_path_for
+from combine_clips import MuxMode, combine_clips_incremental, stream_combined_clips
+from get_video_recording_time import SUPPORTED_EXTENSIONS, get_first_video_recording_time
+from upload_scheduler import UploadPriority, UploadScheduler
+from upload_video import build_request_body, upload_video_stream
+from ingest_index import get_default_index
 from move_files import find_dji_action4_drive, find_fly6pro_drive, move_all_files_in_folder
 
 MAIN_VIDEO_FOLDER = Path("C:/Video/")
@@ -15,6 +22,42 @@ INPUT_VIDEO_FOLDER_PATH = MAIN_VIDEO_FOLDER / "Input"
 OUTPUT_VIDEO_FOLDER_PATH = MAIN_VIDEO_FOLDER / "Output"
 ARCHIVE_VIDEO_FOLDER_PATH = MAIN_VIDEO_FOLDER / "Archive"
 UPLOADED_VIDEO_FOLDER_PATH = MAIN_VIDEO_FOLDER / "Uploaded"
+# Cards ingested straight to the archive disk land here until their ride is named
+INGEST_STAGING_FOLDER_PATH = ARCHIVE_VIDEO_FOLDER_PATH / ".ingest"
+
+# Combining is disk bound and uploading is network bound, so they are limited separately.
+# Combines are further capped per disk (see block_devices), this is the overall limit.
+MAX_CONCURRENT_COMBINES = 4
+MAX_CONCURRENT_UPLOADS = 1
+# Global upload bandwidth cap in MB/s, None for no cap
+MAX_UPLOAD_MB_PER_S = None
+# Extra backup destinations besides YouTube, each fed from the same read of the file
+NAS_BACKUP_FOLDER_PATH: Optional[Path] = None
+S3_BACKUP_BUCKET: Optional[str] = None
+# S3-compatible endpoint such as MinIO ("http://localhost:9000"), None for AWS
+S3_ENDPOINT_URL: Optional[str] = None
+# Combined videos are uploaded, so they are written as fragmented MP4 in a single pass
+COMBINE_MUX_MODE: MuxMode = "upload"
+
+
+def backup_sinks(
+    title: str,
+    description: str,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"],
+    upload_scheduler: UploadScheduler,
+) -> list[BackupSink]:
+    """Returns the destinations a combined video is backed up to."""
+    request_body = build_request_body(title, description, tags, category_id, privacy_status)
+    sinks: list[BackupSink] = [YouTubeSink(request_body, throttle=upload_scheduler.throttle)]
+    if NAS_BACKUP_FOLDER_PATH:
+        sinks.append(FilesystemSink(NAS_BACKUP_FOLDER_PATH))
+    if S3_BACKUP_BUCKET:
+        # A local MinIO is not behind the uplink the bandwidth cap is for
+        throttle = None if S3_ENDPOINT_URL else upload_scheduler.throttle
+        sinks.append(S3Sink(S3_BACKUP_BUCKET, endpoint_url=S3_ENDPOINT_URL, throttle=throttle))
+    return sinks
 
 
 async def upload_and_move(
@@ -25,63 +68,113 @@ async def upload_and_move(
     category_id: int,
     privacy_status: Literal["public", "private", "unlisted"],
     max_upload_retries: int,
+    upload_scheduler: UploadScheduler,
 ):
-    """Uploads a video and moves it to the uploaded folder (async)."""
-    video_id = await upload_video(
-        file_path=file_path,
-        title=title,
-        description=description,
-        tags=tags,
-        category_id=category_id,
-        privacy_status=privacy_status,
-        max_retries=max_upload_retries,
-    )
+    """
+    Backs a video up to every destination, then moves it to the uploaded folder (async).
 
-    if not video_id:
-        logging.error(f"Video upload failed for {file_path}.")
+    The backup runs in a scheduler slot and reads the file once for all
+    destinations. The file is only moved once all of them hold it; otherwise
+    it stays in the output folder and the next run resumes just the
+    destinations still missing it.
+    """
+    sinks = backup_sinks(title, description, tags, category_id, privacy_status, upload_scheduler)
+    async with upload_scheduler.slot(file_path) as progress:
+        results = await fan_out_upload(
+            file_path, sinks, max_retries=max_upload_retries, on_progress=progress
+        )
+
+    failed = [name for name, result in results.items() if not result]
+    if failed:
+        logging.error(f"Video upload failed for {file_path} ({', '.join(failed)}).")
         return False
 
-    uploaded_path = UPLOADED_VIDEO_FOLDER_PATH / file_path.name
+    logging.info(f"Video uploaded with ID: {results[YouTubeSink.name]}")
+    move_to_uploaded(file_path)
+    return True
 
-    logging.info(f"Video uploaded with ID: {video_id}")
-    # move uploaded file to uploaded folder
+
+def move_to_uploaded(file_path: Path) -> Path:
+    """Moves an uploaded video, and its clip manifest if any, to the uploaded folder."""
+    uploaded_path = UPLOADED_VIDEO_FOLDER_PATH / file_path.name
     shutil.move(file_path, uploaded_path)
+    manifest_file = manifest_path_for(file_path)
+    if manifest_file.exists():
+        shutil.move(manifest_file, manifest_path_for(uploaded_path))
     logging.info(f"Files moved to {uploaded_path}")
-    return True
+    return uploaded_path
 
 
-def process_folder(
-    folder: Path,
-):
-    """Processes a single input folder."""
-    if not any(folder.iterdir()):
-        logging.info(f"Folder {folder} is empty. Skipping...")
-        return
+def has_clips(folder: Path) -> bool:
+    """Returns whether a folder holds any video clips, ignoring leftover non-video files."""
+    return any(
+        file.is_file() and file.suffix.lower() in SUPPORTED_EXTENSIONS
+        for file in folder.iterdir()
+    )
+
 
+def get_output_paths(folder: Path) -> tuple[Path, str, str]:
+    """Returns the combined output path, its name and the recording time for a folder."""
     video_datetime = get_first_video_recording_time(folder)
     logging.info(f"video_datetime: {video_datetime}")
 
     output_filename = video_datetime + "_" + folder.name
     output_file_path = OUTPUT_VIDEO_FOLDER_PATH / (output_filename + ".mp4")
+    return output_file_path, output_filename, video_datetime
 
-    try:
-        combine_clips(folder, output_file_path)
-    except FileExistsError:
-        logging.warning(f"Output file already exists: {output_file_path}")
-        user_input = input(
-            f"Output file already exists: {output_file_path}. Do you want to delete it and combine clips? (y/n): "
-        )
-        if user_input.lower() == "y":
-            output_file_path.unlink()
-            combine_clips(folder, output_file_path)
-        else:
-            logging.info("Skipping combining file and continuing with existing video.")
 
+def archive_folder(folder: Path, output_filename: str) -> None:
+    """Moves the source clips of a combined folder to the archive."""
     archive_path = ARCHIVE_VIDEO_FOLDER_PATH / output_filename
     move_all_files_in_folder(folder, archive_path)
     logging.info(f"Files moved to {archive_path}")
 
-    return output_file_path, output_filename, video_datetime
+
+def find_existing_ride(folder: Path, video_datetime: str) -> Optional[Path]:
+    """Returns the manifest of an already combined video of the same ride, if any."""
+    return find_ride_manifest(
+        [OUTPUT_VIDEO_FOLDER_PATH, UPLOADED_VIDEO_FOLDER_PATH],
+        video_datetime,
+        folder.name,
+    )
+
+
+def process_folder(
+    folder: Path,
+    mux_mode: MuxMode = COMBINE_MUX_MODE,
+):
+    """
+    Processes a single input folder.
+
+    Clips already combined for the same ride (per its manifest) are skipped and
+    any new clips are appended as an extra segment, so re-runs and late card
+    dumps never re-mux the whole ride. ``mux_mode`` picks the MP4 layout of
+    the combined video (see combine_clips.MuxMode).
+    """
+    if not has_clips(folder):
+        logging.info(f"Folder {folder} has no clips. Skipping...")
+        return
+
+    output_file_path, output_filename, video_datetime = get_output_paths(folder)
+    manifest_file = find_existing_ride(folder, video_datetime)
+
+    written_path = combine_clips_incremental(
+        folder, output_file_path, manifest_file, mode=mux_mode
+    )
+    # Late clips are archived alongside the rest of their ride
+    archive_name = (
+        manifest_file.name[: -len(MANIFEST_SUFFIX)] if manifest_file else output_filename
+    )
+    archive_folder(folder, archive_name)
+
+    if written_path is None:
+        if not output_file_path.is_file():
+            logging.info(f"No new clips in {folder}. Nothing to upload.")
+            return
+        logging.info("Skipping combining file and continuing with existing video.")
+        written_path = output_file_path
+
+    return written_path, written_path.stem, video_datetime
 
 
 async def check_unuploaded_videos(
@@ -89,11 +182,18 @@ async def check_unuploaded_videos(
     category_id: int,
     privacy_status: Literal["public", "private", "unlisted"],
     max_upload_retries: int,
+    upload_scheduler: Optional[UploadScheduler] = None,
 ):
-    """Checks for and uploads any remaining videos in the output folder."""
+    """
+    Checks for and uploads any remaining videos in the output folder.
+
+    All of them are queued at once, but the scheduler only runs as many
+    uploads as it has slots, newest ride first.
+    """
+    upload_scheduler = upload_scheduler or UploadScheduler(MAX_CONCURRENT_UPLOADS)
     upload_tasks = []
     for file in OUTPUT_VIDEO_FOLDER_PATH.iterdir():
-        if file.is_file():
+        if file.is_file() and file.suffix.lower() == ".mp4":
             logging.warning(f"Video file not uploaded: {file}")
             video_datetime = file.stem.split("_")[0]
             upload_tasks.append(
@@ -105,65 +205,262 @@ async def check_unuploaded_videos(
                     category_id,
                     privacy_status,
                     max_upload_retries,
+                    upload_scheduler,
                 )
             )
     await asyncio.gather(*upload_tasks)
 
 
+async def combine_then_upload(
+    folder: Path,
+    device_limiter: DeviceLimiter,
+    upload_scheduler: UploadScheduler,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"],
+    max_upload_retries: int,
+):
+    """Combines a folder off the event loop, then uploads the result (async)."""
+    async with device_limiter.slot(
+        folder, OUTPUT_VIDEO_FOLDER_PATH, ARCHIVE_VIDEO_FOLDER_PATH
+    ):
+        result = await asyncio.to_thread(process_folder, folder)
+
+    if not result:
+        return False
+
+    output_file_path, output_filename, video_datetime = result
+    return await upload_and_move(
+        output_file_path,
+        output_filename,
+        video_datetime.split("_")[0],
+        tags,
+        category_id,
+        privacy_status,
+        max_upload_retries,
+        upload_scheduler,
+    )
+
+
+def drain(chunks: Iterable[bytes]) -> None:
+    """Consumes the rest of a stream for its side effects."""
+    for _ in chunks:
+        pass
+
+
+async def stream_then_upload(
+    folder: Path,
+    device_limiter: DeviceLimiter,
+    upload_scheduler: UploadScheduler,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"],
+    max_upload_retries: int,
+):
+    """
+    Combines a folder straight into a streaming upload (async).
+
+    The combined video is uploaded while FFmpeg is still producing it and is
+    teed to the output folder, avoiding a full write-then-read of the file.
+    The copy only takes its final name once FFmpeg succeeds, so an
+    interrupted run never leaves a truncated video for
+    check_unuploaded_videos to upload.
+    """
+    if not has_clips(folder):
+        logging.info(f"Folder {folder} has no clips. Skipping...")
+        return False
+
+    output_file_path, output_filename, video_datetime = await asyncio.to_thread(
+        get_output_paths, folder
+    )
+    if output_file_path.exists() or find_existing_ride(folder, video_datetime):
+        # Already (partly) combined, so append and upload from disk instead
+        return await combine_then_upload(
+            folder,
+            device_limiter,
+            upload_scheduler,
+            tags,
+            category_id,
+            privacy_status,
+            max_upload_retries,
+        )
+
+    async with device_limiter.slot(
+        folder, OUTPUT_VIDEO_FOLDER_PATH
+    ), upload_scheduler.slot(output_file_path) as progress:
+        chunks = stream_combined_clips(folder, output_file_path)
+        try:
+            video_id = await upload_video_stream(
+                chunks,
+                output_filename,
+                video_datetime.split("_")[0],
+                tags,
+                category_id,
+                privacy_status,
+                max_upload_retries,
+                on_progress=progress,
+                throttle=upload_scheduler.throttle,
+            )
+            if not video_id:
+                # Finish the local copy so check_unuploaded_videos can retry it
+                await asyncio.to_thread(drain, chunks)
+        except (ValueError, subprocess.CalledProcessError) as e:
+            logging.error(f"Combining {folder} failed: {e}")
+            return False
+        finally:
+            # Abandoning the stream deletes its partial copy; a stream still being
+            # read by a cancelled upload thread cleans up when that thread ends
+            with contextlib.suppress(ValueError):
+                chunks.close()
+
+    await asyncio.to_thread(archive_folder, folder, output_filename)
+
+    if not video_id:
+        logging.error(f"Video upload failed for {output_file_path}.")
+        return False
+
+    move_to_uploaded(output_file_path)
+    return True
+
+
 async def main(
     tags: list[str],
     category_id: int,
     privacy_status: Literal["public", "private", "unlisted"] = "private",
     max_upload_retries: int = 3,
+    max_concurrent_combines: int = MAX_CONCURRENT_COMBINES,
+    max_concurrent_uploads: int = MAX_CONCURRENT_UPLOADS,
+    max_upload_mb_per_s: Optional[float] = MAX_UPLOAD_MB_PER_S,
+    upload_priority: UploadPriority = "newest",
+    stream_uploads: bool = False,
+    ingest_from_cards: bool = False,
 ):
-    """Main function to process video folders."""
+    """
+    Main function to process video folders.
+
+    Folders are pipelined: the upload of one folder runs while the next folder
+    is being combined, with separate limits for the disk-bound combine stage
+    and the network-bound upload stage. Combines run in parallel across
+    disks but are capped per disk by the device limiter. Uploads share one
+    scheduler, which runs them in ``upload_priority`` order under
+    ``max_upload_mb_per_s``. With ``stream_uploads`` each folder is instead
+    uploaded while it is being combined. With ``ingest_from_cards``
+    connected cameras are ingested straight to the archive disk and combined
+    from there, alongside the existing input folders.
+    """
     input_folders = [
         folder for folder in INPUT_VIDEO_FOLDER_PATH.iterdir() if folder.is_dir()
     ]
+    drives = detect_drives() if ingest_from_cards else {}
+    if INGEST_STAGING_FOLDER_PATH.is_dir():
+        # Left over from an interrupted card ingest; a reconnected card picks its own up
+        input_folders += [
+            folder
+            for folder in INGEST_STAGING_FOLDER_PATH.iterdir()
+            if folder.is_dir() and folder.name not in drives
+        ]
 
-    upload_tasks = []
-    for folder in input_folders:
-        result = process_folder(folder)
-        if result:
-            output_file_path, output_filename, video_datetime = result
-            upload_tasks.append(
-                upload_and_move(
-                    output_file_path,
-                    output_filename,
-                    video_datetime.split("_")[0],
-                    tags,
-                    category_id,
-                    privacy_status,
-                    max_upload_retries,
-                )
-            )
+    device_limiter = DeviceLimiter(max_concurrent_combines)
+    upload_scheduler = UploadScheduler(
+        max_concurrent_uploads, max_upload_mb_per_s, upload_priority
+    )
 
-    await asyncio.gather(*upload_tasks)
-    await check_unuploaded_videos(tags, category_id, privacy_status, max_upload_retries)
-
-async def initialize_drives():
-    """Concurrently move files from detected drives to input folders."""
-    fly6pro_drive = find_fly6pro_drive()
-    dji_action4_drive = find_dji_action4_drive()
-    
-    tasks = []
-    if fly6pro_drive:
-        tasks.append(
-            asyncio.to_thread(
-                move_all_files_in_folder,
-                fly6pro_drive,
-                INPUT_VIDEO_FOLDER_PATH / "FLY6PRO"
+    folder_pipeline = stream_then_upload if stream_uploads else combine_then_upload
+    await asyncio.gather(
+        *(
+            folder_pipeline(
+                folder,
+                device_limiter,
+                upload_scheduler,
+                tags,
+                category_id,
+                privacy_status,
+                max_upload_retries,
             )
-        )
-    if dji_action4_drive:
-        tasks.append(
-            asyncio.to_thread(
-                move_all_files_in_folder,
-                dji_action4_drive,
-                INPUT_VIDEO_FOLDER_PATH / "DJI_ACTION4"
+            for folder in input_folders
+        ),
+        *(
+            ingest_card_then_upload(
+                drive,
+                name,
+                device_limiter,
+                upload_scheduler,
+                tags,
+                category_id,
+                privacy_status,
+                max_upload_retries,
             )
+            for name, drive in drives.items()
+        ),
+    )
+    await check_unuploaded_videos(
+        tags, category_id, privacy_status, max_upload_retries, upload_scheduler
+    )
+
+def detect_drives() -> dict[str, str]:
+    """Returns the mount point of each connected camera, keyed by its input folder name."""
+    drives = {"FLY6PRO": find_fly6pro_drive(), "DJI_ACTION4": find_dji_action4_drive()}
+    return {name: drive for name, drive in drives.items() if drive}
+
+
+async def ingest_drive(
+    drive: str, destination: Path, device_limiter: DeviceLimiter
+) -> None:
+    """Moves a card's clips to a folder once both devices have a free slot (async)."""
+    async with device_limiter.slot(drive, destination):
+        await asyncio.to_thread(
+            move_all_files_in_folder, drive, destination, index=get_default_index()
         )
-    await asyncio.gather(*tasks)
+
+
+async def initialize_drives(device_limiter: Optional[DeviceLimiter] = None):
+    """
+    Concurrently move files from detected drives to input folders.
+
+    Clips already ingested from an earlier insertion of the card are skipped.
+    Cards are read in parallel, but writes to one input disk are limited per
+    the device limiter.
+    """
+    device_limiter = device_limiter or DeviceLimiter()
+    await asyncio.gather(
+        *(
+            ingest_drive(drive, INPUT_VIDEO_FOLDER_PATH / name, device_limiter)
+            for name, drive in detect_drives().items()
+        )
+    )
+
+
+async def ingest_card_then_upload(
+    drive: str,
+    camera_name: str,
+    device_limiter: DeviceLimiter,
+    upload_scheduler: UploadScheduler,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"],
+    max_upload_retries: int,
+):
+    """
+    Ingests a card straight onto the archive disk and combines from there (async).
+
+    The card is read exactly once, by the verified ingest copy. Combining then
+    reads the archived clips, and archiving the ride is a rename on the same
+    disk instead of a second copy through ``Input/``. Each card is combined as
+    soon as its own ingest finishes, while other cards are still copying.
+    """
+    staging_folder = INGEST_STAGING_FOLDER_PATH / camera_name
+    await ingest_drive(drive, staging_folder, device_limiter)
+    return await combine_then_upload(
+        staging_folder,
+        device_limiter,
+        upload_scheduler,
+        tags,
+        category_id,
+        privacy_status,
+        max_upload_retries,
+    )
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     # Run initialization and main sequentially in the event loop
@@ -0,0 +1,221 @@
+import json
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import Any, List, Optional
+
+from mp4_boxes import MP4_SUFFIXES, MP4Info, parse_mp4
+from probe_cache import ProbeCache, get_default_cache
+
+# ffprobe is process-spawn bound, so a handful of workers is enough to hide the latency
+MAX_PROBE_WORKERS = 8
+# Packets read from the start of the file to estimate the keyframe interval
+KEYFRAME_PROBE_PACKETS = 64
+
+
+@dataclass(frozen=True, slots=True)
+class MediaInfo:
+    """Everything the pipeline needs to know about a clip, from a single probe."""
+
+    duration: float
+    creation_time: Optional[str] = None
+    codec: Optional[str] = None
+    fps: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    audio_sample_rate: Optional[int] = None
+    keyframe_interval: Optional[float] = None
+
+
+def _parse_frame_rate(rate: Optional[str]) -> Optional[float]:
+    """Converts an ffprobe rational such as '30000/1001' to a float."""
+    if not rate or rate in ("0/0", "0"):
+        return None
+    return float(Fraction(rate))
+
+
+def _keyframe_interval(packets: List[dict[str, Any]], video_index: int) -> Optional[float]:
+    """Returns the mean spacing in seconds between video keyframes in the sampled packets."""
+    keyframe_times = [
+        float(packet["pts_time"])
+        for packet in packets
+        if packet.get("stream_index") == video_index
+        and "K" in packet.get("flags", "")
+        and packet.get("pts_time") not in (None, "N/A")
+    ]
+    if len(keyframe_times) < 2:
+        return None
+    return (keyframe_times[-1] - keyframe_times[0]) / (len(keyframe_times) - 1)
+
+
+def parse_ffprobe_output(metadata: dict[str, Any]) -> MediaInfo:
+    """
+    Builds a MediaInfo from ffprobe JSON output.
+
+    Raises:
+        ValueError: If the container reports no duration
+    """
+    fmt = metadata.get("format", {})
+    streams = metadata.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    duration = fmt.get("duration")
+    if duration is None:
+        raise ValueError("No duration reported by ffprobe")
+
+    return MediaInfo(
+        duration=float(duration),
+        creation_time=fmt.get("tags", {}).get("creation_time"),
+        codec=video.get("codec_name"),
+        fps=_parse_frame_rate(video.get("avg_frame_rate") or video.get("r_frame_rate")),
+        width=video.get("width"),
+        height=video.get("height"),
+        audio_sample_rate=int(audio["sample_rate"]) if "sample_rate" in audio else None,
+        keyframe_interval=_keyframe_interval(
+            metadata.get("packets", []), video.get("index", -1)
+        ),
+    )
+
+
+def media_info_from_mp4(info: MP4Info) -> MediaInfo:
+    """Converts the box reader's MP4Info to a MediaInfo."""
+    video = info.track("vide")
+    audio = info.track("soun")
+
+    fps = None
+    keyframe_interval = None
+    if video and video.duration and video.timescale:
+        video_seconds = video.duration / video.timescale
+        fps = video.sample_count / video_seconds
+        if video.sync_sample_count:
+            keyframe_interval = video_seconds / video.sync_sample_count
+
+    return MediaInfo(
+        duration=info.duration,
+        creation_time=(
+            info.creation_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            if info.creation_time
+            else None
+        ),
+        codec=video.codec if video else None,
+        fps=fps,
+        width=video.width if video else None,
+        height=video.height if video else None,
+        audio_sample_rate=audio.timescale if audio else None,
+        keyframe_interval=keyframe_interval,
+    )
+
+
+def read_media_info(file_path: Path) -> MediaInfo:
+    """
+    Reads the MediaInfo of a file, preferring the in-process MP4 box reader.
+
+    MP4/MOV clips are parsed directly; ffprobe is only spawned for other
+    containers, or for files such as fragmented MP4s whose ``moov`` carries no
+    duration.
+
+    Raises:
+        InvalidMP4Error: If an MP4 clip is truncated (a ValueError)
+        subprocess.CalledProcessError: If FFprobe command fails
+        ValueError: If the ffprobe output cannot be interpreted
+    """
+    if file_path.suffix.lower() in MP4_SUFFIXES:
+        info = parse_mp4(file_path)
+        if info.duration > 0:
+            return media_info_from_mp4(info)
+    return run_ffprobe(file_path)
+
+
+def run_ffprobe(file_path: Path) -> MediaInfo:
+    """
+    Runs a single JSON ffprobe over a file for format, streams and leading packets.
+
+    Args:
+        file_path: Path to the video file
+
+    Returns:
+        MediaInfo for the file
+
+    Raises:
+        subprocess.CalledProcessError: If FFprobe command fails
+        ValueError: If the output cannot be interpreted
+    """
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_format",
+            "-show_streams",
+            "-show_entries",
+            "packet=stream_index,pts_time,flags",
+            "-read_intervals",
+            f"%+#{KEYFRAME_PROBE_PACKETS}",
+            "-of",
+            "json",
+            str(file_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    try:
+        metadata = json.loads(result.stdout)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid ffprobe output for {file_path}: {e}") from e
+    return parse_ffprobe_output(metadata)
+
+
+def probe_media(file_path: Path, cache: Optional[ProbeCache] = None) -> MediaInfo:
+    """
+    Returns the MediaInfo of a file, reading it only on a cache miss.
+
+    The cache is not written back to disk here; call ``cache.save()`` (or use
+    ``probe_media_many``) once a batch of probes is done.
+    """
+    cache = cache or get_default_cache()
+    cached = cache.get(file_path)
+    if cached is not None and "media_info" in cached:
+        return MediaInfo(**cached["media_info"])
+
+    info = read_media_info(file_path)
+    cache.set(file_path, {"media_info": asdict(info)})
+    return info
+
+
+def probe_media_many(
+    files: List[Path],
+    max_workers: int = MAX_PROBE_WORKERS,
+    cache: Optional[ProbeCache] = None,
+) -> tuple[dict[Path, MediaInfo], List[Path]]:
+    """
+    Probes many files, reading uncached ones concurrently.
+
+    Args:
+        files: Paths to the video files
+        max_workers: Maximum number of concurrent FFprobe processes
+        cache: Probe cache to read from and update, defaults to the project cache
+
+    Returns:
+        Tuple of a mapping from file to MediaInfo, and the list of files that
+        could not be probed
+    """
+    cache = cache or get_default_cache()
+    infos: dict[Path, MediaInfo] = {}
+    invalid_files: List[Path] = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {file: executor.submit(probe_media, file, cache) for file in files}
+        for file, future in futures.items():
+            try:
+                infos[file] = future.result()
+            except (ValueError, subprocess.CalledProcessError) as e:
+                logging.error(f"Error probing {file}: {e}")
+                invalid_files.append(file)
+
+    cache.save()
+    return infos, invalid_files
@@ -1,23 +1,36 @@
 import logging
 import os
 from pathlib import Path
-import shutil
 import os
 import platform
 import logging
 from typing import Optional, Dict
 
+from block_devices import is_rotational
+from ingest import DEFAULT_INGEST_WORKERS, IngestJournal, ingest_files
+from ingest_index import IngestIndex, get_default_index
+from repair_clip import TRUNCATED_SUFFIX
+
 
 def move_all_files_in_folder(
-    input_folder: Path, output_folder: Path, extensions: list[str] = [".mp4", ".lrf"]
+    input_folder: Path,
+    output_folder: Path,
+    extensions: list[str] = [".mp4", ".lrf", TRUNCATED_SUFFIX],
+    index: Optional[IngestIndex] = None,
 ) -> None:
     """
     Moves all files from the input folder to the output folder, renaming files
     in the destination if conflicts occur while preserving original files.
 
+    Copies across devices are checksummed and verified before the source is
+    deleted, and journalled so an interrupted card dump resumes where it stopped.
+    The journal is removed again once every file has been moved.
+
     Args:
         input_folder: Source directory containing files to move
         output_folder: Target directory for moved files
+        index: Ingest index of clips already taken off a card; clips found in
+            it are left where they are instead of being copied again
     """
     logging.info(f"Moving files from {input_folder} to {output_folder}")
     # Create output directory if it doesn't exist
@@ -31,35 +44,76 @@ def move_all_files_in_folder(
             # if file name starts with LKM, skip it
             if file.startswith("LKM"):
                 continue
-            if file.lower().endswith(tuple(".lrf")):
-                # delete it
-                src_path = Path(root) / file
+            src_path = Path(root) / file
+            if file.lower().endswith(".lrf"):
+                # Low resolution proxies are not needed, delete them
                 src_path.unlink()
-            if file.lower().endswith(tuple(extensions)):
-                src_path = Path(root) / file
+                continue
+            if file.lower().endswith(tuple(extensions)) and src_path.parent != output_folder:
                 files_to_move.append(src_path)
 
+    keys: dict[Path, tuple[int, str]] = {}
+    if index is not None:
+        files_to_move = skip_already_ingested(files_to_move, index, keys)
+
+    # Resolve name conflicts against one listing instead of a stat per candidate
+    journal = IngestJournal(output_folder)
+    taken = {p.name for p in output_folder.iterdir()}
+    pairs: list[tuple[Path, Path]] = []
     for src_path in files_to_move:
-        # Skip the output folder if it's inside input folder
-        if src_path == output_folder:
+        previous = journal.verified_copy(src_path)
+        if previous:
+            # Interrupted run: the verified copy already holds this name
+            pairs.append((src_path, previous))
             continue
 
-        # Create destination path and handle name conflicts
-        dest_path = output_folder / src_path.name
+        name = src_path.name
         conflict_number = 0
-
-        # Find first available filename
-        while dest_path.exists():
+        while name in taken:
             conflict_number += 1
-            stem = src_path.stem
-            suffix = src_path.suffix
-            dest_path = output_folder / f"{stem}_{conflict_number}{suffix}"
-
-        # Perform the move
-        shutil.move(str(src_path), str(dest_path))
-        logging.info(
-            f"Moved '{src_path.name}' to '{dest_path.relative_to(output_folder.parent)}'"
-        )
+            name = f"{src_path.stem}_{conflict_number}{src_path.suffix}"
+        taken.add(name)
+        pairs.append((src_path, output_folder / name))
+
+    # Parallel writers only make a spinning destination disk seek between files
+    max_workers = 1 if is_rotational(output_folder) else DEFAULT_INGEST_WORKERS
+    results = ingest_files(pairs, max_workers=max_workers, journal=journal)
+    if len(results) == len(pairs):
+        # Every source is gone, so the journal has nothing left to resume
+        journal.remove()
+    if index is not None:
+        for result in results:
+            index.record(keys[result.source], result.source.name, result.destination)
+
+
+def skip_already_ingested(
+    files: list[Path], index: IngestIndex, keys: dict[Path, tuple[int, str]]
+) -> list[Path]:
+    """
+    Drops clips that were ingested before, or that repeat within this batch.
+
+    Args:
+        files: Candidate clips on the card
+        index: Persistent ingest index
+        keys: Filled with the index key of every clip that is kept
+
+    Returns:
+        The clips that still need to be ingested
+    """
+    kept: list[Path] = []
+    seen: set[tuple[int, str]] = set()
+    for src_path in files:
+        key = index.key(src_path)
+        previous = index.lookup(key)
+        if previous or key in seen:
+            logging.info(
+                f"Skipping '{src_path.name}', already ingested as '{previous or 'this batch'}'"
+            )
+            continue
+        seen.add(key)
+        keys[src_path] = key
+        kept.append(src_path)
+    return kept
 
 
 def find_fly6pro_drive() -> Optional[str]:
@@ -131,6 +185,10 @@ if __name__ == "__main__":
     dji_action4_drive = find_dji_action4_drive()
     MAIN_FOLDER = Path("C:/Video/Input")
     if fly6pro_drive:
-        move_all_files_in_folder(fly6pro_drive, MAIN_FOLDER / "FLY6PRO")
+        move_all_files_in_folder(
+            fly6pro_drive, MAIN_FOLDER / "FLY6PRO", index=get_default_index()
+        )
     if dji_action4_drive:
-        move_all_files_in_folder(dji_action4_drive, MAIN_FOLDER / "DJI_ACTION4")
+        move_all_files_in_folder(
+            dji_action4_drive, MAIN_FOLDER / "DJI_ACTION4", index=get_default_index()
+        )
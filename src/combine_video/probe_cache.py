@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+# Cache lives next to the other project-level state (see upload_video.SECRETS_DIR)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_DIR = PROJECT_ROOT / "cache"
+PROBE_CACHE_FILE = CACHE_DIR / "probe_cache.json"
+
+
+class ProbeCache:
+    """
+    Persistent on-disk cache of ffprobe results.
+
+    Entries are keyed by the resolved file path and are only considered valid
+    while the file's size and modification time are unchanged, so a re-written
+    or replaced clip is always probed again.
+    """
+
+    def __init__(self, cache_file: Path = PROBE_CACHE_FILE):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries: dict[str, dict[str, Any]] = {}
+
+        if cache_file.exists():
+            try:
+                self._entries = json.loads(cache_file.read_text())
+            except (json.JSONDecodeError, OSError) as e:
+                logging.warning(f"Ignoring unreadable probe cache {cache_file}: {e}")
+
+    @staticmethod
+    def _stat_key(file_path: Path) -> tuple[str, int, int]:
+        stat = file_path.stat()
+        return str(file_path.resolve()), stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path: Path) -> Optional[dict[str, Any]]:
+        """Returns the cached probe data for a file, or None if missing or stale."""
+        path, size, mtime_ns = self._stat_key(file_path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+            return entry["data"]
+        return None
+
+    def set(self, file_path: Path, data: dict[str, Any]) -> None:
+        """Stores probe data for a file against its current size and mtime."""
+        path, size, mtime_ns = self._stat_key(file_path)
+        with self._lock:
+            self._entries[path] = {"size": size, "mtime_ns": mtime_ns, "data": data}
+            self._dirty = True
+
+    def save(self) -> None:
+        """Atomically writes the cache back to disk if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps(self._entries))
+            os.replace(tmp_file, self.cache_file)
+            self._dirty = False
+
+
+_default_cache: Optional[ProbeCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ProbeCache:
+    """Returns the process-wide probe cache, loading it from disk on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ProbeCache()
+        return _default_cache
@@ -0,0 +1,471 @@
+import logging
+import mmap
+import os
+import struct
+import subprocess
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from ffmpeg_progress import PROGRESS_ARGS, FFmpegMonitor, LoggingSink
+from mp4_boxes import InvalidMP4Error, find_box, iter_boxes, parse_mp4
+
+# The broken original is kept next to its repaired copy under this suffix
+TRUNCATED_SUFFIX = ".truncated"
+# Repairs are written to <clip name>.partial, which no clip listing picks up
+PARTIAL_SUFFIX = ".partial"
+ANNEX_B_START_CODE = b"\0\0\0\1"
+# Visual sample entries carry 78 bytes of fixed fields before their child boxes
+VISUAL_SAMPLE_ENTRY_SIZE = 78
+# Reference samples whose NAL units are learned; enough to span several GOPs
+REFERENCE_SAMPLES = 1000
+# NAL units larger than the reference's largest sample times this are misreads
+MAX_NAL_SIZE_FACTOR = 2
+# Header bytes plus the first payload byte, which open the slice header
+NAL_SIGNATURE_SIZE = {"h264": 2, "hevc": 3}
+# A repair that finds fewer video NAL units than this is treated as a failure
+MIN_REPAIRED_NALS = 2
+
+
+@dataclass(frozen=True, slots=True)
+class StreamParameters:
+    """What a truncated clip cannot tell about itself, read from a healthy sibling."""
+
+    codec: str  # "h264" or "hevc", FFmpeg's raw elementary stream format
+    nal_length_size: int
+    parameter_sets: tuple[bytes, ...]
+    fps: float
+    video_timescale: int
+    max_nal_size: int
+    # Leading bytes of every kind of NAL unit the encoder wrote in the reference
+    nal_signatures: frozenset[bytes]
+    audio_sample_rate: Optional[int] = None
+    audio_channels: Optional[int] = None
+
+
+def _avcc_parameter_sets(buf, payload: int) -> tuple[int, List[bytes]]:
+    """Returns the NAL length size and the SPS/PPS units of an avcC box."""
+    nal_length_size = (buf[payload + 4] & 3) + 1
+    sets = []
+    offset = payload + 5
+    for count_mask in (0x1F, 0xFF):  # SPS count, then PPS count
+        count = buf[offset] & count_mask
+        offset += 1
+        for _ in range(count):
+            (length,) = struct.unpack_from(">H", buf, offset)
+            sets.append(bytes(buf[offset + 2 : offset + 2 + length]))
+            offset += 2 + length
+    return nal_length_size, sets
+
+
+def _hvcc_parameter_sets(buf, payload: int) -> tuple[int, List[bytes]]:
+    """Returns the NAL length size and the VPS/SPS/PPS units of an hvcC box."""
+    nal_length_size = (buf[payload + 21] & 3) + 1
+    sets = []
+    offset = payload + 23
+    for _ in range(buf[payload + 22]):
+        (count,) = struct.unpack_from(">H", buf, offset + 1)
+        offset += 3
+        for _ in range(count):
+            (length,) = struct.unpack_from(">H", buf, offset)
+            sets.append(bytes(buf[offset + 2 : offset + 2 + length]))
+            offset += 2 + length
+    return nal_length_size, sets
+
+
+def _sample_ranges(buf, stbl: tuple[int, int], limit: int) -> tuple[List[tuple[int, int]], int]:
+    """
+    Returns the (start, end) of up to ``limit`` samples of a track, and its largest sample size.
+
+    Raises:
+        InvalidMP4Error: If the sample table is incomplete
+    """
+    stsz = find_box(buf, stbl[0], stbl[1], [b"stsz"])
+    stsc = find_box(buf, stbl[0], stbl[1], [b"stsc"])
+    stco = find_box(buf, stbl[0], stbl[1], [b"stco"])
+    co64 = find_box(buf, stbl[0], stbl[1], [b"co64"])
+    if not stsz or not stsc or not (stco or co64):
+        raise InvalidMP4Error("Video track has an incomplete sample table")
+
+    uniform_size, sample_count = struct.unpack_from(">II", buf, stsz[0] + 4)
+    if uniform_size:
+        sizes = [uniform_size] * sample_count
+    else:
+        sizes = list(struct.unpack_from(f">{sample_count}I", buf, stsz[0] + 12))
+    if stco:
+        (chunk_count,) = struct.unpack_from(">I", buf, stco[0] + 4)
+        offsets = struct.unpack_from(f">{chunk_count}I", buf, stco[0] + 8)
+    else:
+        (chunk_count,) = struct.unpack_from(">I", buf, co64[0] + 4)
+        offsets = struct.unpack_from(f">{chunk_count}Q", buf, co64[0] + 8)
+    (entry_count,) = struct.unpack_from(">I", buf, stsc[0] + 4)
+    runs = [struct.unpack_from(">III", buf, stsc[0] + 8 + 12 * i) for i in range(entry_count)]
+
+    ranges: List[tuple[int, int]] = []
+    sample = 0
+    for i, (first_chunk, samples_per_chunk, _) in enumerate(runs):
+        last_chunk = runs[i + 1][0] - 1 if i + 1 < len(runs) else chunk_count
+        for chunk in range(first_chunk - 1, last_chunk):
+            position = offsets[chunk]
+            for _ in range(samples_per_chunk):
+                if sample >= min(limit, sample_count):
+                    return ranges, max(sizes, default=0)
+                ranges.append((position, position + sizes[sample]))
+                position += sizes[sample]
+                sample += 1
+    return ranges, max(sizes, default=0)
+
+
+def read_stream_parameters(reference: Path) -> StreamParameters:
+    """
+    Reads the codec configuration, frame rate, audio layout and NAL unit shapes of a healthy clip.
+
+    Walking the NAL units of the reference's first samples records the
+    leading bytes of each kind of NAL unit the encoder writes. A clip from
+    the same encoder settings starts its NAL units with the same bytes,
+    which is what tells video apart from audio when scanning a broken clip.
+
+    Raises:
+        InvalidMP4Error: If the clip has no H.264/HEVC video track
+    """
+    info = parse_mp4(reference)
+    video = info.track("vide")
+    if not video or not video.duration or not video.timescale:
+        raise InvalidMP4Error(f"{reference.name} has no usable video track")
+    fps = video.sample_count / (video.duration / video.timescale)
+
+    with reference.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        moov = find_box(buf, 0, len(buf), [b"moov"])
+        config = video_stbl = None
+        audio_sample_rate = audio_channels = None
+        for box_type, payload, box_end in iter_boxes(buf, moov[0], moov[1]):
+            if box_type != b"trak":
+                continue
+            stsd = find_box(buf, payload, box_end, [b"mdia", b"minf", b"stbl", b"stsd"])
+            if not stsd:
+                continue
+            # Skip version, flags and entry count to the first sample entry
+            entry_type, entry_payload, entry_end = next(iter_boxes(buf, stsd[0] + 8, stsd[1]))
+            children = entry_payload + VISUAL_SAMPLE_ENTRY_SIZE
+            if entry_type in (b"avc1", b"avc3", b"hvc1", b"hev1"):
+                video_stbl = find_box(buf, payload, box_end, [b"mdia", b"minf", b"stbl"])
+            if entry_type in (b"avc1", b"avc3"):
+                avcc = find_box(buf, children, entry_end, [b"avcC"])
+                config = ("h264", *_avcc_parameter_sets(buf, avcc[0])) if avcc else None
+            elif entry_type in (b"hvc1", b"hev1"):
+                hvcc = find_box(buf, children, entry_end, [b"hvcC"])
+                config = ("hevc", *_hvcc_parameter_sets(buf, hvcc[0])) if hvcc else None
+            elif entry_type == b"mp4a":
+                (audio_channels,) = struct.unpack_from(">H", buf, entry_payload + 16)
+                (audio_sample_rate,) = struct.unpack_from(">I", buf, entry_payload + 24)
+                audio_sample_rate >>= 16  # 16.16 fixed point
+
+        if config is None:
+            raise InvalidMP4Error(f"{reference.name} has no H.264/HEVC codec configuration")
+        codec, nal_length_size, parameter_sets = config
+
+        samples, max_sample_size = _sample_ranges(buf, video_stbl, REFERENCE_SAMPLES)
+        signature_size = NAL_SIGNATURE_SIZE[codec]
+        signatures = set()
+        for position, sample_end in samples:
+            while position + nal_length_size + signature_size <= sample_end:
+                length = int.from_bytes(buf[position : position + nal_length_size], "big")
+                start = position + nal_length_size
+                signatures.add(bytes(buf[start : start + signature_size]))
+                position = start + length
+
+    return StreamParameters(
+        codec=codec,
+        nal_length_size=nal_length_size,
+        parameter_sets=tuple(parameter_sets),
+        fps=fps,
+        video_timescale=video.timescale,
+        max_nal_size=max_sample_size * MAX_NAL_SIZE_FACTOR,
+        nal_signatures=frozenset(signatures),
+        audio_sample_rate=audio_sample_rate,
+        audio_channels=audio_channels,
+    )
+
+
+def find_mdat(buf) -> Optional[tuple[int, int]]:
+    """
+    Returns (payload_start, end) of the top-level ``mdat`` box of a possibly truncated file.
+
+    A clip cut off mid-recording has an ``mdat`` whose size is zero or runs
+    past the end of the file; its payload is taken to end at end of file.
+    """
+    offset = 0
+    end = len(buf)
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, offset)
+        header = 8
+        if size == 1 and offset + 16 <= end:
+            (size,) = struct.unpack_from(">Q", buf, offset + 8)
+            header = 16
+        if box_type == b"mdat":
+            box_end = offset + size if size >= header else end
+            return offset + header, min(box_end, end)
+        if size < header:
+            return None
+        offset += size
+    return None
+
+
+def _nal_header_valid(buf, pos: int, codec: str) -> bool:
+    """Checks that the NAL unit header at pos is well-formed."""
+    header = buf[pos]
+    if header & 0x80:  # forbidden_zero_bit
+        return False
+    if codec == "h264":
+        return 1 <= header & 0x1F <= 23
+    layer_id = ((header & 1) << 5) | (buf[pos + 1] >> 3)
+    temporal_id_plus1 = buf[pos + 1] & 7
+    return not layer_id and temporal_id_plus1 and (header >> 1) & 0x3F <= 40
+
+
+def _nal_at(buf, pos: int, end: int, params: StreamParameters, resync: bool) -> int:
+    """
+    Returns the length of a plausible NAL unit at pos, or 0 if there is none.
+
+    When resynchronising, the NAL unit must also open with a signature seen in
+    the reference clip.
+    """
+    n = params.nal_length_size
+    signature_size = NAL_SIGNATURE_SIZE[params.codec]
+    if pos + n + signature_size > end:
+        return 0
+    length = int.from_bytes(buf[pos : pos + n], "big")
+    if not signature_size <= length <= params.max_nal_size or pos + n + length > end:
+        return 0
+    if resync:
+        if buf[pos + n : pos + n + signature_size] not in params.nal_signatures:
+            return 0
+    elif not _nal_header_valid(buf, pos + n, params.codec):
+        return 0
+    return length
+
+
+def starts_picture(buf, nal_start: int, codec: str) -> bool:
+    """Returns whether a NAL unit is the first slice of a picture."""
+    header = buf[nal_start]
+    if codec == "h264":
+        # first_mb_in_slice is 0, coded as a single set bit
+        return header & 0x1F in (1, 5) and bool(buf[nal_start + 1] & 0x80)
+    # first_slice_segment_in_pic_flag of a VCL NAL unit
+    return (header >> 1) & 0x3F < 32 and bool(buf[nal_start + 2] & 0x80)
+
+
+def iter_nal_units(
+    buf, start: int, end: int, params: StreamParameters
+) -> Iterator[tuple[int, int]]:
+    """
+    Yields (start, end) offsets of the video NAL units in an ``mdat`` payload, in file order.
+
+    Samples are stored as length-prefixed NAL units, with chunks of audio and
+    metadata samples in between. Those are skipped by resynchronising on the
+    next position that looks like a NAL unit this encoder writes. A NAL unit
+    cut off by the end of the file is dropped.
+    """
+    n = params.nal_length_size
+    pos = start
+    while pos < end:
+        length = _nal_at(buf, pos, end, params, resync=False)
+        if length:
+            yield pos + n, pos + n + length
+            pos += n + length
+            continue
+
+        # NAL units are far below 16 MB, so their length prefix starts with a zero byte
+        pos = buf.find(b"\0", pos + 1, end)
+        while pos != -1 and not _nal_at(buf, pos, end, params, resync=True):
+            pos = buf.find(b"\0", pos + 1, end)
+        if pos == -1:
+            return
+
+
+def mux_command(
+    params: StreamParameters,
+    seconds: float,
+    recorded: datetime,
+    output_path: Path,
+    container: str = "mp4",
+) -> List[str]:
+    """
+    Returns the FFmpeg command that muxes an Annex-B stream on stdin, plus silence, into an MP4.
+
+    ``container`` names the muxer ("mp4" or "mov"), as a ``.partial`` output
+    path does not tell FFmpeg which one to use.
+    """
+    args = [
+        "ffmpeg",
+        *PROGRESS_ARGS,
+        "-fflags",
+        "+genpts",
+        "-f",
+        params.codec,
+        "-framerate",
+        f"{params.fps:.6f}",
+        "-i",
+        "pipe:0",
+    ]
+    if params.audio_sample_rate:
+        layout = "mono" if params.audio_channels == 1 else "stereo"
+        args += [
+            "-f",
+            "lavfi",
+            "-i",
+            f"anullsrc=r={params.audio_sample_rate}:cl={layout}:d={seconds:.3f}",
+            "-c:a",
+            "aac",
+        ]
+    # Matching the reference's timescale keeps the concat from rescaling timestamps
+    args += ["-c:v", "copy", "-video_track_timescale", str(params.video_timescale)]
+    if params.codec == "hevc":
+        args += ["-tag:v", "hvc1"]
+    return args + [
+        "-metadata",
+        f"creation_time={recorded.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}",
+        "-f",
+        container,
+        "-y",
+        str(output_path),
+    ]
+
+
+def repair_truncated_clip(
+    broken: Path,
+    reference: Path,
+    output_path: Optional[Path] = None,
+) -> Path:
+    """
+    Rebuilds a playable clip from one whose recording was cut off before ``moov`` was written.
+
+    The video NAL units are read straight out of ``mdat`` and piped to FFmpeg
+    as an Annex-B stream, headed by the parameter sets of a healthy clip from
+    the same camera, and stream-copied into a new MP4 at the reference's
+    frame rate; nothing is re-encoded. The audio samples cannot be delimited
+    without the index, so they are replaced by silence in the reference's
+    layout, keeping the stream layout the same for the concat.
+
+    Args:
+        broken: The truncated clip
+        reference: A healthy clip recorded with the same settings
+        output_path: Where to write the repaired clip; by default the broken
+            clip is renamed with TRUNCATED_SUFFIX and the repair takes its name
+
+    Returns:
+        Path of the repaired clip
+
+    Raises:
+        InvalidMP4Error: If the reference cannot be read or no video is recovered
+        subprocess.CalledProcessError: If FFmpeg command fails
+    """
+    params = read_stream_parameters(reference)
+    source = broken
+    if output_path is None:
+        output_path = broken
+        source = broken.with_name(broken.name + TRUNCATED_SUFFIX)
+        broken.rename(source)
+    partial_path = output_path.with_name(output_path.name + PARTIAL_SUFFIX)
+
+    def discard() -> None:
+        partial_path.unlink(missing_ok=True)
+        if source != broken:
+            source.rename(broken)
+
+    monitor = FFmpegMonitor(sinks=[LoggingSink(f"Repairing {broken.name}")])
+    try:
+        with source.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            mdat = find_mdat(buf)
+            if mdat is None:
+                raise InvalidMP4Error(f"{broken.name} has no mdat box to recover")
+            # Only headers are read here; the payloads are read once, while piping
+            nals = list(iter_nal_units(buf, mdat[0], mdat[1], params))
+            if len(nals) < MIN_REPAIRED_NALS:
+                raise InvalidMP4Error(f"No video recovered from {broken.name}")
+            pictures = sum(starts_picture(buf, start, params.codec) for start, _ in nals)
+            seconds = pictures / params.fps
+            monitor.total_duration = seconds
+
+            # The clip was last written when it was cut off, i.e. when the recording ended
+            recorded = datetime.fromtimestamp(
+                source.stat().st_mtime, timezone.utc
+            ) - timedelta(seconds=seconds)
+            process = subprocess.Popen(
+                mux_command(
+                    params, seconds, recorded, partial_path, output_path.suffix.lower()[1:]
+                ),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            stderr_thread = monitor.start(process.stderr)
+            try:
+                for parameter_set in params.parameter_sets:
+                    process.stdin.write(ANNEX_B_START_CODE + parameter_set)
+                with memoryview(buf) as view:
+                    for nal_start, nal_end in nals:
+                        process.stdin.write(ANNEX_B_START_CODE)
+                        process.stdin.write(view[nal_start:nal_end])
+                process.stdin.close()
+            except BrokenPipeError:
+                pass  # FFmpeg exited early, its error output says why
+            process.wait()
+            stderr_thread.join()
+    except BaseException:
+        discard()
+        raise
+
+    if process.returncode != 0:
+        discard()
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=monitor.error_output()
+        )
+    os.replace(partial_path, output_path)
+    logging.info(
+        f"Repaired {broken.name} from {reference.name}: {seconds:.1f}s of video, "
+        f"{output_path.stat().st_size / 1e6:.1f} of {source.stat().st_size / 1e6:.1f} MB kept"
+    )
+    return output_path
+
+
+def restore_truncated_clips(folder: Path) -> List[Path]:
+    """
+    Renames back every truncated original whose repair never took its name.
+
+    A repair that was killed part way leaves the broken clip under
+    TRUNCATED_SUFFIX and perhaps a ``.partial`` output; the clip gets its name
+    back, so it is listed and repaired again.
+
+    Returns:
+        The clips that were restored
+    """
+    restored = []
+    for source in folder.glob("*" + TRUNCATED_SUFFIX):
+        clip = source.with_name(source.name[: -len(TRUNCATED_SUFFIX)])
+        if clip.exists():
+            continue  # Repaired, the original is kept for reference
+        clip.with_name(clip.name + PARTIAL_SUFFIX).unlink(missing_ok=True)
+        source.rename(clip)
+        logging.warning(f"Restored {clip.name} from an interrupted repair")
+        restored.append(clip)
+    return restored
+
+
+def find_reference_clip(broken: Path, healthy: List[Path]) -> Optional[Path]:
+    """Returns the healthy clip recorded closest before the broken one, or after it if none."""
+    ordered = sorted(healthy, key=lambda f: f.name.lower())
+    before = [clip for clip in ordered if clip.name.lower() < broken.name.lower()]
+    if before:
+        return before[-1]
+    return ordered[0] if ordered else None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    folder = Path("C:/Video/Input/DJI_ACTION4")
+    broken = Path(sys.argv[1]) if len(sys.argv) > 1 else folder / "DJI_0042.MP4"
+    reference = Path(sys.argv[2]) if len(sys.argv) > 2 else folder / "DJI_0041.MP4"
+    repair_truncated_clip(broken, reference)
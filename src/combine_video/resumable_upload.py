@@ -0,0 +1,384 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import requests
+
+YOUTUBE_UPLOAD_URL = "https://www.googleapis.com/upload/youtube/v3/videos"
+# Every chunk except the last must be a multiple of 256 KiB
+CHUNK_GRANULARITY = 256 * 1024
+DEFAULT_CHUNK_SIZE = 32 * CHUNK_GRANULARITY
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+# Adaptive chunking aims for each PUT to take about this long on the measured link
+TARGET_CHUNK_SECONDS = 8.0
+MIN_CHUNK_SIZE = 4 * CHUNK_GRANULARITY
+MAX_CHUNK_SIZE = 512 * CHUNK_GRANULARITY
+# (connect, read) seconds before a stalled request fails and is retried
+REQUEST_TIMEOUT = (30, 300)
+# Failures that leave the session resumable, so the chunk is retried
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+# Called with (bytes acknowledged, total bytes) whenever the server confirms progress
+UploadProgress = Callable[[int, int], None]
+# Awaited with the size of each chunk before it is sent, e.g. to cap bandwidth
+UploadThrottle = Callable[[int], Awaitable[None]]
+# Blocking form of UploadThrottle, for uploads running in a worker thread
+BlockingThrottle = Callable[[int], None]
+
+
+class ResumableUploadError(Exception):
+    """Raised when the resumable-upload endpoint rejects a request."""
+
+
+class UploadAlreadyComplete(ResumableUploadError):
+    """Raised when a session being resumed has already received the whole upload."""
+
+    def __init__(self, resource: dict[str, Any]):
+        super().__init__(f"Upload already complete: {resource.get('id')}")
+        self.resource = resource
+
+
+def start_resumable_session(
+    session: requests.Session,
+    metadata: dict[str, Any],
+    upload_url: str = YOUTUBE_UPLOAD_URL,
+    content_length: Optional[int] = None,
+) -> str:
+    """
+    Opens a resumable upload session and returns its session URI.
+
+    Args:
+        session: HTTP session, normally an authorised google-auth session
+        metadata: Video resource body (snippet and status)
+        upload_url: Resumable upload endpoint, overridable for local fakes
+        content_length: Total upload size, if known up front
+
+    Raises:
+        ResumableUploadError: If the endpoint does not return a session URI
+    """
+    headers = {"X-Upload-Content-Type": "video/*"}
+    if content_length is not None:
+        headers["X-Upload-Content-Length"] = str(content_length)
+
+    response = session.post(
+        upload_url,
+        params={"uploadType": "resumable", "part": "snippet,status"},
+        json=metadata,
+        headers=headers,
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code != 200 or "Location" not in response.headers:
+        raise ResumableUploadError(
+            f"Failed to start upload session ({response.status_code}): {response.text}"
+        )
+    return response.headers["Location"]
+
+
+def acknowledged_end(response: requests.Response) -> int:
+    """Returns the number of bytes the server has persisted, from its Range header."""
+    range_header = response.headers.get("Range")
+    if not range_header:
+        return 0
+    return int(range_header.split("-")[-1]) + 1
+
+
+def query_upload_offset(session: requests.Session, session_uri: str) -> int:
+    """
+    Asks the server how many bytes of an interrupted session it has persisted.
+
+    Raises:
+        UploadAlreadyComplete: If the session already finished, with the created resource
+        ResumableUploadError: If the session cannot be resumed
+    """
+    response = session.put(
+        session_uri, headers={"Content-Range": "bytes */*"}, timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code == 308:
+        return acknowledged_end(response)
+    if response.status_code in (200, 201):
+        raise UploadAlreadyComplete(response.json())
+    raise ResumableUploadError(
+        f"Unexpected status while querying upload ({response.status_code}): {response.text}"
+    )
+
+
+def upload_stream(
+    session: requests.Session,
+    session_uri: str,
+    chunks: Iterable[bytes],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_retries: int = 3,
+    on_progress: Optional[UploadProgress] = None,
+    throttle: Optional[BlockingThrottle] = None,
+) -> dict[str, Any]:
+    """
+    Uploads a stream of unknown length to a resumable session as it is produced.
+
+    Incoming data is buffered until a full chunk is available; intermediate
+    chunks are sent with an open-ended ``Content-Range`` and the final chunk
+    declares the total size.
+
+    Args:
+        session: HTTP session, normally an authorised google-auth session
+        session_uri: URI returned by start_resumable_session
+        chunks: Byte chunks of any size, in order
+        chunk_size: Upload chunk size, a multiple of 256 KiB
+        max_retries: Consecutive failures tolerated per chunk
+        on_progress: Called with the acknowledged bytes; the total is 0 until
+            the final chunk, as the length is not known before then
+        throttle: Called with the size of each chunk before it is sent
+
+    Returns:
+        The JSON resource returned by the server on completion
+
+    Raises:
+        ResumableUploadError: If the upload is rejected or retries are exhausted
+    """
+    if chunk_size % CHUNK_GRANULARITY:
+        raise ValueError(f"Chunk size must be a multiple of {CHUNK_GRANULARITY} bytes")
+
+    buffer = bytearray()
+    offset = 0  # Bytes acknowledged by the server, i.e. the position of buffer[0]
+
+    def resync() -> None:
+        """Drops whatever the server already persisted after a failed request."""
+        nonlocal offset
+        try:
+            acknowledged = query_upload_offset(session, session_uri) - offset
+        except (*RETRYABLE_ERRORS, ResumableUploadError):
+            return
+        offset += acknowledged
+        del buffer[:acknowledged]
+
+    def send(final: bool) -> Optional[requests.Response]:
+        nonlocal offset
+        retry_count = 0
+        while True:
+            if not final and len(buffer) < chunk_size:
+                return None
+            size = len(buffer) if final else chunk_size
+            total = str(offset + len(buffer)) if final else "*"
+            if size:
+                content_range = f"bytes {offset}-{offset + size - 1}/{total}"
+            else:
+                content_range = f"bytes */{total}"
+
+            if throttle and size:
+                throttle(size)
+            try:
+                response = session.put(
+                    session_uri,
+                    data=bytes(buffer[:size]),
+                    headers={"Content-Range": content_range},
+                    timeout=REQUEST_TIMEOUT,
+                )
+            except RETRYABLE_ERRORS as e:
+                error = str(e)
+            else:
+                if response.status_code in (200, 201):
+                    offset += size
+                    del buffer[:size]
+                    if on_progress:
+                        on_progress(offset, offset)
+                    return response
+                if response.status_code == 308 and acknowledged_end(response) > offset:
+                    acknowledged = acknowledged_end(response) - offset
+                    offset += acknowledged
+                    del buffer[:acknowledged]
+                    if on_progress:
+                        on_progress(offset, 0)
+                    return None
+                if response.status_code not in (308, *RETRYABLE_STATUS_CODES):
+                    raise ResumableUploadError(
+                        f"Upload rejected ({response.status_code}): {response.text}"
+                    )
+                error = f"HTTP {response.status_code}"
+
+            # Includes a 308 that acknowledged nothing new, so a stuck session gives up
+            retry_count += 1
+            if retry_count > max_retries:
+                raise ResumableUploadError(f"Max retries exceeded: {error}")
+            logging.warning(f"Upload error ({error}), retry {retry_count}/{max_retries}")
+            time.sleep(2**retry_count)
+            resync()
+
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= chunk_size:
+            send(final=False)
+
+    while True:
+        response = send(final=True)
+        if response is not None:
+            return response.json()
+
+
+def adapt_chunk_size(
+    chunk_size: int,
+    bytes_sent: int,
+    seconds: float,
+    target_seconds: float = TARGET_CHUNK_SECONDS,
+) -> int:
+    """
+    Picks the next chunk size from the throughput of the last chunk.
+
+    The size moves at most by a factor of two per chunk, stays a multiple of
+    256 KiB and is clamped between MIN_CHUNK_SIZE and MAX_CHUNK_SIZE.
+    """
+    rate = bytes_sent / max(seconds, 1e-3)
+    wanted = min(max(int(rate * target_seconds), chunk_size // 2), chunk_size * 2)
+    wanted -= wanted % CHUNK_GRANULARITY
+    return min(max(wanted, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+
+def put_chunk(
+    session: requests.Session,
+    session_uri: str,
+    data: memoryview,
+    offset: int,
+    total: int,
+) -> requests.Response:
+    """Sends one chunk of a file of known size; an empty chunk just finalises the upload."""
+    if len(data):
+        content_range = f"bytes {offset}-{offset + len(data) - 1}/{total}"
+    else:
+        content_range = f"bytes */{total}"
+    return session.put(
+        session_uri,
+        data=data,
+        headers={"Content-Range": content_range},
+        timeout=REQUEST_TIMEOUT,
+    )
+
+
+async def upload_file(
+    session: requests.Session,
+    session_uri: str,
+    file_path: Path,
+    offset: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_retries: int = 3,
+    on_progress: Optional[UploadProgress] = None,
+    throttle: Optional[UploadThrottle] = None,
+) -> dict[str, Any]:
+    """
+    Uploads a file to a resumable session from asyncio.
+
+    Two reusable buffers are filled with ``readinto`` and sent as memoryviews,
+    so chunk data is never copied: while one chunk is in flight the next is
+    read from disk into the other buffer. After each acknowledged chunk the
+    chunk size is adapted to the measured bandwidth.
+
+    Args:
+        session: HTTP session, normally the shared authorised google-auth session
+        session_uri: URI returned by start_resumable_session
+        file_path: File to upload
+        offset: Byte offset already persisted by the server, to resume a session
+        chunk_size: Initial upload chunk size, a multiple of 256 KiB
+        max_retries: Consecutive failures tolerated per chunk
+        on_progress: Called whenever the server acknowledges more data
+        throttle: Awaited before each chunk is sent
+
+    Returns:
+        The JSON resource returned by the server on completion
+
+    Raises:
+        ResumableUploadError: If the upload is rejected or retries are exhausted
+    """
+    if chunk_size % CHUNK_GRANULARITY:
+        raise ValueError(f"Chunk size must be a multiple of {CHUNK_GRANULARITY} bytes")
+
+    total = file_path.stat().st_size
+    buffers = [bytearray(), bytearray()]
+
+    with file_path.open("rb", buffering=0) as f:
+
+        def read_at(position: int, slot: int) -> memoryview:
+            """Fills one of the two buffers with the chunk starting at position."""
+            size = min(chunk_size, total - position)
+            if len(buffers[slot]) < size:
+                buffers[slot] = bytearray(size)
+            view = memoryview(buffers[slot])[:size]
+            f.seek(position)
+            filled = 0
+            while filled < size and (n := f.readinto(view[filled:])):
+                filled += n
+            return view[:filled]
+
+        slot = 0
+        chunk = await asyncio.to_thread(read_at, offset, slot)
+        retry_count = 0
+
+        while True:
+            end = offset + len(chunk)
+            prefetch = None
+            if end < total:
+                prefetch = asyncio.create_task(asyncio.to_thread(read_at, end, 1 - slot))
+
+            if throttle:
+                await throttle(len(chunk))
+            started = time.monotonic()
+            try:
+                response = await asyncio.to_thread(
+                    put_chunk, session, session_uri, chunk, offset, total
+                )
+            except RETRYABLE_ERRORS as e:
+                response = None
+                error = str(e)
+            else:
+                error = f"HTTP {response.status_code}"
+
+            if response is not None and response.status_code in (200, 201):
+                if prefetch:
+                    await prefetch
+                if on_progress:
+                    on_progress(total, total)
+                return response.json()
+
+            if response is not None and response.status_code == 308 and (
+                acknowledged_end(response) > offset
+            ):
+                acknowledged = acknowledged_end(response)
+                retry_count = 0
+                if acknowledged == end:
+                    chunk_size = adapt_chunk_size(
+                        chunk_size, len(chunk), time.monotonic() - started
+                    )
+            elif response is not None and response.status_code not in (
+                308,
+                *RETRYABLE_STATUS_CODES,
+            ):
+                if prefetch:
+                    await prefetch
+                raise ResumableUploadError(
+                    f"Upload rejected ({response.status_code}): {response.text}"
+                )
+            else:
+                # Includes a 308 that acknowledged nothing new, so a stuck session gives up
+                retry_count += 1
+                if retry_count > max_retries:
+                    if prefetch:
+                        await prefetch
+                    raise ResumableUploadError(f"Max retries exceeded: {error}")
+                logging.warning(f"Upload error ({error}), retry {retry_count}/{max_retries}")
+                await asyncio.sleep(2**retry_count)
+                try:
+                    acknowledged = await asyncio.to_thread(
+                        query_upload_offset, session, session_uri
+                    )
+                except (*RETRYABLE_ERRORS, ResumableUploadError):
+                    acknowledged = offset
+
+            # The file handle is shared, so the prefetch must finish before any re-read
+            next_chunk = await prefetch if prefetch else None
+            if on_progress and acknowledged != offset:
+                on_progress(acknowledged, total)
+
+            if acknowledged == end and next_chunk is not None:
+                offset, chunk, slot = end, next_chunk, 1 - slot
+            elif acknowledged != offset:
+                # Partially acknowledged, re-read from the server's position
+                offset = acknowledged
+                chunk = await asyncio.to_thread(read_at, offset, slot)
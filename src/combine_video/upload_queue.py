@@ -0,0 +1,163 @@
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from probe_cache import CACHE_DIR
+
+UPLOAD_QUEUE_FILE = CACHE_DIR / "upload_queue.sqlite3"
+
+
+@dataclass(frozen=True, slots=True)
+class UploadRecord:
+    """Persisted state of one video upload."""
+
+    content_hash: str
+    path: str
+    size: int
+    session_uri: Optional[str]
+    offset: int
+    video_id: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class SinkRecord:
+    """Persisted state of one file's backup to one destination."""
+
+    content_hash: str
+    sink: str
+    state: Optional[str]  # Whatever the destination needs to resume, e.g. a session URI
+    offset: int
+    result: Optional[str]  # Video ID, path or URL once the backup is complete
+
+
+class UploadQueue:
+    """
+    Persistent record of uploads, so a crash never restarts a file from byte zero.
+
+    Uploads are keyed by the video's partial content hash, so a renamed or
+    moved file is still recognised. Each row keeps the resumable session URI
+    and the last offset the server acknowledged, and the video ID once done.
+    """
+
+    def __init__(self, db_file: Path = UPLOAD_QUEUE_FILE):
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " content_hash TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " session_uri TEXT,"
+            " offset_bytes INTEGER NOT NULL DEFAULT 0,"
+            " video_id TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sink_uploads ("
+            " content_hash TEXT NOT NULL,"
+            " sink TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " state TEXT,"
+            " offset_bytes INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (content_hash, sink))"
+        )
+        self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def get(self, content_hash: str) -> Optional[UploadRecord]:
+        """Returns the stored state of an upload, or None if it was never started."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, path, size, session_uri, offset_bytes, video_id"
+                " FROM uploads WHERE content_hash = ?",
+                (content_hash,),
+            ).fetchone()
+        return UploadRecord(*row) if row else None
+
+    def start(self, content_hash: str, path: Path, size: int, session_uri: str) -> None:
+        """Records a newly opened resumable session for a file."""
+        self._execute(
+            "INSERT OR REPLACE INTO uploads"
+            " (content_hash, path, size, session_uri, offset_bytes, video_id, updated_at)"
+            " VALUES (?, ?, ?, ?, 0, NULL, ?)",
+            (content_hash, str(path), size, session_uri, time.time()),
+        )
+
+    def update_offset(self, content_hash: str, offset: int) -> None:
+        """Records the byte offset the server has confirmed."""
+        self._execute(
+            "UPDATE uploads SET offset_bytes = ?, updated_at = ? WHERE content_hash = ?",
+            (offset, time.time(), content_hash),
+        )
+
+    def complete(self, content_hash: str, video_id: str) -> None:
+        """Marks an upload as finished; its session is no longer needed."""
+        self._execute(
+            "UPDATE uploads SET video_id = ?, session_uri = NULL, updated_at = ?"
+            " WHERE content_hash = ?",
+            (video_id, time.time(), content_hash),
+        )
+        logging.info(f"Upload of {content_hash} recorded as video {video_id}")
+
+    def get_sink(self, content_hash: str, sink: str) -> Optional[SinkRecord]:
+        """Returns the stored state of a backup to one destination, or None if never started."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, sink, state, offset_bytes, result"
+                " FROM sink_uploads WHERE content_hash = ? AND sink = ?",
+                (content_hash, sink),
+            ).fetchone()
+        return SinkRecord(*row) if row else None
+
+    def start_sink(
+        self, content_hash: str, sink: str, path: Path, size: int, state: str, offset: int
+    ) -> None:
+        """Records a newly opened or resumed backup to one destination."""
+        self._execute(
+            "INSERT OR REPLACE INTO sink_uploads"
+            " (content_hash, sink, path, size, state, offset_bytes, result, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, NULL, ?)",
+            (content_hash, sink, str(path), size, state, offset, time.time()),
+        )
+
+    def update_sink_offset(self, content_hash: str, sink: str, offset: int) -> None:
+        """Records the byte offset one destination has persisted."""
+        self._execute(
+            "UPDATE sink_uploads SET offset_bytes = ?, updated_at = ?"
+            " WHERE content_hash = ? AND sink = ?",
+            (offset, time.time(), content_hash, sink),
+        )
+
+    def complete_sink(self, content_hash: str, sink: str, result: str) -> None:
+        """Marks a backup to one destination as finished."""
+        self._execute(
+            "UPDATE sink_uploads SET result = ?, state = NULL, updated_at = ?"
+            " WHERE content_hash = ? AND sink = ?",
+            (result, time.time(), content_hash, sink),
+        )
+        logging.info(f"Backup of {content_hash} to {sink} recorded as {result}")
+
+
+_default_queue: Optional[UploadQueue] = None
+_default_queue_lock = threading.Lock()
+
+
+def get_default_queue() -> UploadQueue:
+    """Returns the process-wide upload queue, opening it on first use."""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = UploadQueue()
+        return _default_queue
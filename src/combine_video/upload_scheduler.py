@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Literal, Optional
+
+from resumable_upload import MAX_CHUNK_SIZE
+
+# How often aggregate upload throughput is logged while uploads are running
+REPORT_INTERVAL = 30.0
+
+UploadPriority = Literal["newest", "smallest"]
+
+
+class TokenBucket:
+    """
+    Caps the average rate of a sequence of sends, shared by all uploads.
+
+    A send may overdraw the bucket by up to one chunk; the sender then sleeps
+    until the debt is repaid, holding up everyone else behind it.
+    """
+
+    def __init__(self, rate: float, burst: float = MAX_CHUNK_SIZE):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def consume(self, amount: int) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
+
+
+@dataclass(slots=True)
+class UploadStats:
+    """Progress of one running upload; called with (acknowledged, total) as it advances."""
+
+    name: str
+    scheduler: "UploadScheduler"
+    started: float = field(default_factory=time.monotonic)
+    first_offset: Optional[int] = None
+    acknowledged: int = 0
+    total: int = 0
+
+    def __call__(self, acknowledged: int, total: int) -> None:
+        if self.first_offset is None:
+            # A resumed upload only counts the bytes sent in this run
+            self.first_offset = self.acknowledged = acknowledged
+        self.scheduler.bytes_sent += acknowledged - self.acknowledged
+        self.acknowledged = acknowledged
+        self.total = total
+        self.scheduler.maybe_report()
+
+    @property
+    def mb_per_s(self) -> float:
+        sent = self.acknowledged - (self.first_offset or 0)
+        elapsed = time.monotonic() - self.started
+        return sent / 1e6 / elapsed if elapsed else 0.0
+
+    def describe(self) -> str:
+        percent = self.acknowledged / self.total * 100 if self.total else 0.0
+        return f"{self.name} {percent:.0f}% at {self.mb_per_s:.1f} MB/s"
+
+
+class UploadScheduler:
+    """
+    Runs uploads a few at a time, in priority order, under a global bandwidth cap.
+
+    Uploads wait for a slot in ``slot()``; when one frees up it goes to the
+    waiting upload with the newest ride (or the smallest file), not to
+    whichever asked first. Per-upload and aggregate throughput are logged
+    every REPORT_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 1,
+        max_mb_per_s: Optional[float] = None,
+        priority: UploadPriority = "newest",
+        report_interval: float = REPORT_INTERVAL,
+    ):
+        self.max_concurrent = max_concurrent
+        self.priority = priority
+        self.report_interval = report_interval
+        self.bucket = TokenBucket(max_mb_per_s * 1e6) if max_mb_per_s else None
+        self.active: dict[str, UploadStats] = {}
+        self.bytes_sent = 0
+        self._running = 0
+        self._waiting: list[tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._last_report = time.monotonic()
+        self._bytes_at_last_report = 0
+
+    def priority_of(self, file_path: Path) -> float:
+        """Returns the sort key of an upload; lower values are uploaded first."""
+        if self.priority == "smallest":
+            return file_path.stat().st_size if file_path.exists() else 0.0
+        try:
+            # Output files are named after the ride's start time
+            recorded = datetime.strptime(file_path.name[:15], "%Y%m%d_%H%M%S").timestamp()
+        except ValueError:
+            recorded = file_path.stat().st_mtime if file_path.exists() else time.time()
+        return -recorded
+
+    async def throttle(self, nbytes: int) -> None:
+        """Waits until nbytes may be sent under the bandwidth cap."""
+        if self.bucket:
+            await self.bucket.consume(nbytes)
+
+    async def _acquire(self, priority: float) -> None:
+        if self._running < self.max_concurrent and not self._waiting:
+            self._running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._counter), future))
+        # The releasing upload hands its slot over by resolving the future
+        await future
+
+    def _release(self) -> None:
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    @asynccontextmanager
+    async def slot(self, file_path: Path) -> AsyncIterator[UploadStats]:
+        """Waits for an upload slot, yielding a progress callback for the upload."""
+        await self._acquire(self.priority_of(file_path))
+        stats = UploadStats(file_path.name, self)
+        self.active[file_path.name] = stats
+        try:
+            yield stats
+        finally:
+            del self.active[file_path.name]
+            self._release()
+            logging.info(
+                f"Upload slot released: {stats.describe()}, "
+                f"{time.monotonic() - stats.started:.0f}s"
+            )
+
+    def maybe_report(self) -> None:
+        """Logs aggregate and per-upload throughput if a report is due."""
+        now = time.monotonic()
+        elapsed = now - self._last_report
+        if elapsed < self.report_interval:
+            return
+        mb_per_s = (self.bytes_sent - self._bytes_at_last_report) / 1e6 / elapsed
+        self._last_report = now
+        self._bytes_at_last_report = self.bytes_sent
+        uploads = "; ".join(stats.describe() for stats in self.active.values())
+        logging.info(
+            f"Uploading {len(self.active)} files ({len(self._waiting)} queued) "
+            f"at {mb_per_s:.1f} MB/s total: {uploads}"
+        )
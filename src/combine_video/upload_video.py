@@ -1,17 +1,31 @@
 import asyncio
 from pathlib import Path
-import ssl
-from typing import Literal
+import threading
+from typing import Iterable, Literal, Optional
+
+import requests
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.credentials import Credentials
 import logging
 from tqdm import tqdm
 import os
 
+from resumable_upload import (
+    YOUTUBE_UPLOAD_URL,
+    ResumableUploadError,
+    UploadAlreadyComplete,
+    UploadProgress,
+    UploadThrottle,
+    query_upload_offset,
+    start_resumable_session,
+    upload_file,
+    upload_stream,
+)
+from fingerprint import partial_hash
+from upload_queue import UploadQueue, get_default_queue
+
 # Configuration setup
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 SECRETS_DIR = PROJECT_ROOT / "secrets"
@@ -21,13 +35,24 @@ SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
 API_SERVICE_NAME = "youtube"
 API_VERSION = "v3"
 
-# Validate secrets directory
-if not SECRETS_DIR.exists():
-    raise FileNotFoundError(f"Secrets directory not found: {SECRETS_DIR}")
+_upload_session: Optional[AuthorizedSession] = None
+_upload_session_lock = threading.Lock()
 
 
-def get_authenticated_service() -> build:
-    """Authenticates and returns YouTube API service instance."""
+def get_credentials() -> Credentials:
+    """
+    Loads, refreshes or creates the OAuth credentials for the YouTube API.
+
+    The secrets directory is only checked here, so importing this module
+    (e.g. for the benchmark against a local fake) does not need it.
+
+    Raises:
+        FileNotFoundError: If the secrets directory does not exist
+    """
+    # Validate secrets directory
+    if not SECRETS_DIR.exists():
+        raise FileNotFoundError(f"Secrets directory not found: {SECRETS_DIR}")
+
     creds = None
     if TOKEN_FILE.exists():
         creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
@@ -43,43 +68,55 @@ def get_authenticated_service() -> build:
 
         TOKEN_FILE.write_text(creds.to_json())
 
-    return build(API_SERVICE_NAME, API_VERSION, credentials=creds)
+    return creds
 
 
-async def upload_video(
-    file_path: Path,
-    title: str,
-    description: str,
-    tags: list[str],
-    category_id: int,
-    privacy_status: Literal["public", "private", "unlisted"] = "private",
-    max_retries: int = 3,
-) -> str | None:
-    """
-    Uploads a video to YouTube with resumable support, progress tracking, and async.
+def get_authenticated_service() -> build:
+    """Authenticates and returns YouTube API service instance."""
+    return build(API_SERVICE_NAME, API_VERSION, credentials=get_credentials())
+
+
+def get_upload_session() -> Optional[AuthorizedSession]:
     """
-    if not file_path.is_file():
-        raise FileNotFoundError(f"Video file not found: {file_path}")
+    Returns the process-wide authorised session used for uploads.
 
-    try:
-        youtube = get_authenticated_service()
-    except Exception as e:
-        if "invalid_grant" in str(e):
+    The session keeps its connection pool across uploads, and google-auth
+    refreshes the access token in place when it expires, so nothing is rebuilt
+    per video. Returns None if authentication fails.
+    """
+    global _upload_session
+    with _upload_session_lock:
+        if _upload_session is not None:
+            return _upload_session
+        try:
+            creds = get_credentials()
+        except Exception as e:
+            if "invalid_grant" not in str(e):
+                logging.error(f"Authentication error: {e}")
+                return None
             logging.error("Token expired or revoked. Deleting token and retrying.")
             if TOKEN_FILE.exists():
                 os.remove(TOKEN_FILE)
             try:
-                youtube = get_authenticated_service()  # try again after deleting token.
+                creds = get_credentials()  # try again after deleting token.
             except Exception as retry_e:
                 logging.error(
                     f"Failed to re-authenticate after token deletion: {retry_e}"
                 )
                 return None
-        else:
-            logging.error(f"Authentication error: {e}")
-            return None
+        _upload_session = AuthorizedSession(creds)
+        return _upload_session
+
 
-    request_body = {
+def build_request_body(
+    title: str,
+    description: str,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"],
+) -> dict:
+    """Builds the video resource body, truncating fields to YouTube's limits."""
+    return {
         "snippet": {
             "title": title[:100],
             "description": description[:5000],
@@ -89,61 +126,201 @@ async def upload_video(
         "status": {"privacyStatus": privacy_status},
     }
 
-    media = MediaFileUpload(
-        str(file_path), mimetype="video/*", chunksize=5 * 1024 * 1024, resumable=True
+
+def open_or_resume_session(
+    session: requests.Session,
+    queue: UploadQueue,
+    content_hash: str,
+    file_path: Path,
+    request_body: dict,
+    upload_url: str = YOUTUBE_UPLOAD_URL,
+) -> tuple[str, int, Optional[str]]:
+    """
+    Returns the session URI and confirmed byte offset to continue an upload from.
+
+    A session recorded in the queue is resumed from the last byte the server
+    acknowledged; if it has expired, a new session is opened and recorded. If
+    the recorded session already completed (e.g. the final response was lost),
+    its video ID is recorded in the queue and returned as the third item, so
+    the file is not uploaded a second time.
+    """
+    record = queue.get(content_hash)
+    if record and record.session_uri:
+        try:
+            offset = query_upload_offset(session, record.session_uri)
+            logging.info(f"Resuming upload of {file_path.name} from byte {offset}")
+            return record.session_uri, offset, None
+        except UploadAlreadyComplete as e:
+            video_id = e.resource.get("id")
+            queue.complete(content_hash, video_id)
+            logging.info(f"{file_path.name} had already finished uploading as video {video_id}")
+            return record.session_uri, record.size, video_id
+        except (ResumableUploadError, requests.RequestException) as e:
+            logging.warning(f"Cannot resume upload of {file_path.name}, restarting: {e}")
+
+    size = file_path.stat().st_size
+    session_uri = start_resumable_session(session, request_body, upload_url, size)
+    queue.start(content_hash, file_path, size, session_uri)
+    return session_uri, 0, None
+
+
+async def upload_video(
+    file_path: Path,
+    title: str,
+    description: str,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"] = "private",
+    max_retries: int = 3,
+    upload_url: str = YOUTUBE_UPLOAD_URL,
+    session: Optional[requests.Session] = None,
+    queue: Optional[UploadQueue] = None,
+    on_progress: Optional[UploadProgress] = None,
+    throttle: Optional[UploadThrottle] = None,
+) -> str | None:
+    """
+    Uploads a video to YouTube with resumable support, progress tracking, and async.
+
+    All uploads share one authorised session. The next chunk is read from disk
+    while the current one is in flight, and the chunk size follows the
+    measured bandwidth. Passing ``upload_url`` and a plain ``session`` allows
+    running against a local fake of the resumable-upload endpoint.
+
+    Progress is persisted in the upload queue: after a crash the upload resumes
+    from the last acknowledged byte, and a file whose content was already
+    uploaded returns its existing video ID without being sent again.
+
+    Progress goes to ``on_progress`` if given (e.g. an UploadScheduler slot),
+    otherwise to a tqdm bar; ``throttle`` is awaited before every chunk.
+    """
+    if not file_path.is_file():
+        raise FileNotFoundError(f"Video file not found: {file_path}")
+
+    queue = queue or get_default_queue()
+    content_hash = await asyncio.to_thread(partial_hash, file_path)
+    record = queue.get(content_hash)
+    if record and record.video_id:
+        logging.info(f"{file_path.name} was already uploaded as video {record.video_id}")
+        return record.video_id
+
+    if session is None:
+        session = get_upload_session()
+        if session is None:
+            return None
+
+    request_body = build_request_body(
+        title, description, tags, category_id, privacy_status
     )
+    total = file_path.stat().st_size
+
+    progress_bar = None
+    if on_progress is None:
+        progress_bar = tqdm(total=total, desc=f"Uploading {title}", unit="B", unit_scale=True)
+
+        def on_progress(acknowledged: int, _total: int) -> None:
+            progress_bar.update(acknowledged - progress_bar.n)
+
+    def record_progress(acknowledged: int, total: int) -> None:
+        on_progress(acknowledged, total)
+        queue.update_offset(content_hash, acknowledged)
 
     try:
-        request = youtube.videos().insert(
-            part="snippet,status", body=request_body, media_body=media
+        session_uri, offset, video_id = await asyncio.to_thread(
+            open_or_resume_session,
+            session,
+            queue,
+            content_hash,
+            file_path,
+            request_body,
+            upload_url,
         )
+        on_progress(offset, total)
+        if video_id:
+            return video_id
+        response = await upload_file(
+            session,
+            session_uri,
+            file_path,
+            offset=offset,
+            max_retries=max_retries,
+            on_progress=record_progress,
+            throttle=throttle,
+        )
+    except (ResumableUploadError, requests.RequestException) as e:
+        logging.error(f"Upload failed: {e}")
+        return None
+    finally:
+        if progress_bar is not None:
+            progress_bar.close()
+
+    video_id = response.get("id")
+    queue.complete(content_hash, video_id)
+    logging.info(f"Upload complete! Video ID: {video_id}")
+    return video_id
 
-        with tqdm(total=100, desc=f"Uploading {title}", unit="%") as pbar:
-            retry_count = 0
-            previous_percent = 0
-            response = None
-
-            while response is None:
-                try:
-                    status, response = await asyncio.to_thread(request.next_chunk)
-                    if status:
-                        current = int(status.progress() * 100)
-                        pbar.update(current - previous_percent)
-                        previous_percent = current
-                    retry_count = 0
-
-                except HttpError as e:
-                    if (
-                        e.resp.status in [500, 502, 503, 504]
-                        and retry_count < max_retries
-                    ):
-                        retry_count += 1
-                        logging.warning(
-                            f"Server error ({e}), retry {retry_count}/{max_retries}"
-                        )
-                        continue
-                    raise
-                except ssl.SSLEOFError as e: #Add this block.
-                    retry_count += 1
-                    if retry_count <= max_retries:
-                        logging.warning(f"SSL Error (retry {retry_count}/{max_retries}): {e}")
-                        await asyncio.sleep(2**retry_count) #exponential backoff.
-                        continue
-                    else:
-                        logging.error(f"SSL Error: Max retries exceeded. Upload failed. {e}")
-                        return None
-
-        if previous_percent < 100:
-            pbar.update(100 - previous_percent)
-
-        video_id = response.get("id")
-        print(f"\nUpload complete! Video ID: {video_id}")
-        return video_id
-
-    except HttpError as e:
-        print(f"Upload failed: {e}")
+
+async def upload_video_stream(
+    chunks: Iterable[bytes],
+    title: str,
+    description: str,
+    tags: list[str],
+    category_id: int,
+    privacy_status: Literal["public", "private", "unlisted"] = "private",
+    max_retries: int = 3,
+    upload_url: str = YOUTUBE_UPLOAD_URL,
+    session: Optional[requests.Session] = None,
+    on_progress: Optional[UploadProgress] = None,
+    throttle: Optional[UploadThrottle] = None,
+) -> str | None:
+    """
+    Uploads a video to YouTube while it is still being produced.
+
+    The stream is sent through the resumable-upload protocol with an open-ended
+    length, so no local file has to be complete before the upload starts.
+    Passing ``upload_url`` and a plain ``session`` allows running against a
+    local fake of the resumable-upload endpoint.
+
+    The upload runs in a worker thread; ``on_progress`` (e.g. an
+    UploadScheduler slot) and ``throttle`` are run on the calling event loop.
+    """
+    if session is None:
+        session = get_upload_session()
+        if session is None:
+            return None
+
+    request_body = build_request_body(
+        title, description, tags, category_id, privacy_status
+    )
+
+    loop = asyncio.get_running_loop()
+
+    def report_progress(acknowledged: int, total: int) -> None:
+        loop.call_soon_threadsafe(on_progress, acknowledged, total)
+
+    def wait_for_throttle(nbytes: int) -> None:
+        asyncio.run_coroutine_threadsafe(throttle(nbytes), loop).result()
+
+    def run_upload() -> dict:
+        session_uri = start_resumable_session(session, request_body, upload_url)
+        return upload_stream(
+            session,
+            session_uri,
+            chunks,
+            max_retries=max_retries,
+            on_progress=report_progress if on_progress else None,
+            throttle=wait_for_throttle if throttle else None,
+        )
+
+    try:
+        response = await asyncio.to_thread(run_upload)
+    except (ResumableUploadError, requests.RequestException) as e:
+        logging.error(f"Streaming upload failed: {e}")
         return None
 
+    video_id = response.get("id")
+    logging.info(f"Streaming upload complete! Video ID: {video_id}")
+    return video_id
+
 
 if __name__ == "__main__":
     # Example usage with parameter validation
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import select
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Literal, Optional
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional, the Input tree is polled instead
+    Observer = None
+    FileSystemEventHandler = object
+
+from block_devices import DeviceLimiter
+from main import (
+    INGEST_STAGING_FOLDER_PATH,
+    INPUT_VIDEO_FOLDER_PATH,
+    MAX_CONCURRENT_COMBINES,
+    MAX_CONCURRENT_UPLOADS,
+    MAX_UPLOAD_MB_PER_S,
+    combine_then_upload,
+    detect_drives,
+    has_clips,
+    ingest_card_then_upload,
+)
+from upload_scheduler import UploadPriority, UploadScheduler
+
+# Fallback rescan period when no change notification arrives
+POLL_INTERVAL = 10.0
+# A folder is combined once its clips have not changed for this long
+SETTLE_SECONDS = 30.0
+# The kernel flags this file whenever the mount table changes
+MOUNTS_FILE = Path("/proc/self/mounts")
+
+FolderSnapshot = frozenset[tuple[str, int, int]]
+
+
+def snapshot_folder(folder: Path) -> FolderSnapshot:
+    """Returns the name, size and mtime of every file in a folder."""
+    snapshot = set()
+    for file in folder.iterdir():
+        if file.is_file():
+            stat = file.stat()
+            snapshot.add((file.name, stat.st_size, stat.st_mtime_ns))
+    return frozenset(snapshot)
+
+
+def input_folders() -> list[Path]:
+    """Returns the Input folders and any card staging folders left on the archive disk."""
+    parents = [INPUT_VIDEO_FOLDER_PATH]
+    if INGEST_STAGING_FOLDER_PATH.is_dir():
+        parents.append(INGEST_STAGING_FOLDER_PATH)
+    return [folder for parent in parents for folder in parent.iterdir() if folder.is_dir()]
+
+
+def scan_input_folders() -> dict[Path, tuple[FolderSnapshot, bool]]:
+    """Returns the snapshot of every input folder and whether it holds any clips."""
+    return {folder: (snapshot_folder(folder), has_clips(folder)) for folder in input_folders()}
+
+
+def watch_mounts(notify: Callable[[], None], stop: threading.Event) -> None:
+    """
+    Calls notify whenever a filesystem is mounted or unmounted (Linux).
+
+    Blocks on ``poll`` of the mount table, so drives are detected the moment
+    they appear instead of by rescanning every mount point.
+    """
+    with MOUNTS_FILE.open() as mounts:
+        poller = select.poll()
+        poller.register(mounts, select.POLLERR | select.POLLPRI)
+        while not stop.is_set():
+            if poller.poll(1000):
+                mounts.seek(0)
+                mounts.read()  # Re-arms the notification
+                notify()
+
+
+class InputEventHandler(FileSystemEventHandler):
+    """Wakes the service on any change under the Input tree."""
+
+    def __init__(self, notify: Callable[[], None]):
+        super().__init__()
+        self.notify = notify
+
+    def on_any_event(self, event) -> None:
+        self.notify()
+
+
+class WatchService:
+    """
+    Long-running mode: ingests cards as they are plugged in and combines settled folders.
+
+    Cards are detected only when the kernel's mount table notification fires
+    on Linux, and on every POLL_INTERVAL rescan elsewhere. Each card is
+    ingested straight to the archive disk and combined from there (see
+    ingest_card_then_upload). The Input tree is watched with watchdog
+    (inotify on Linux) when it is installed, otherwise rescanned every
+    POLL_INTERVAL seconds. An input or leftover staging folder is only
+    combined once its clips have been unchanged for ``settle_seconds``, so a
+    card still being copied is never combined early. Both scans run off the
+    event loop, which the uploads and combines share.
+    """
+
+    def __init__(
+        self,
+        tags: list[str],
+        category_id: int,
+        privacy_status: Literal["public", "private", "unlisted"] = "private",
+        max_upload_retries: int = 3,
+        max_concurrent_combines: int = MAX_CONCURRENT_COMBINES,
+        max_concurrent_uploads: int = MAX_CONCURRENT_UPLOADS,
+        max_upload_mb_per_s: Optional[float] = MAX_UPLOAD_MB_PER_S,
+        upload_priority: UploadPriority = "newest",
+        poll_interval: float = POLL_INTERVAL,
+        settle_seconds: float = SETTLE_SECONDS,
+    ):
+        self.upload_args = (tags, category_id, privacy_status, max_upload_retries)
+        self.device_limiter = DeviceLimiter(max_concurrent_combines)
+        self.upload_scheduler = UploadScheduler(
+            max_concurrent_uploads, max_upload_mb_per_s, upload_priority
+        )
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+
+        self.wake = asyncio.Event()
+        # Set by the mount watcher, so cards are only looked for when mounts change
+        self.mounts_changed = True
+        self.ingested_drives: dict[str, str] = {}
+        self.busy_folders: set[Path] = set()
+        # Last seen contents of each input folder and when they last changed
+        self.snapshots: dict[Path, tuple[FolderSnapshot, float]] = {}
+        # Contents already handed to a combine, so a failed folder is not retried in a loop
+        self.combined: dict[Path, FolderSnapshot] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda _: self.wake.set())
+
+    async def _ingest(self, name: str, drive: str) -> None:
+        staging_folder = INGEST_STAGING_FOLDER_PATH / name
+        self.busy_folders.add(staging_folder)
+        try:
+            await ingest_card_then_upload(
+                drive, name, self.device_limiter, self.upload_scheduler, *self.upload_args
+            )
+        except Exception as e:
+            logging.error(f"Ingest from {drive} failed: {e}")
+        finally:
+            self.busy_folders.discard(staging_folder)
+
+    async def _combine(self, folder: Path) -> None:
+        self.busy_folders.add(folder)
+        try:
+            await combine_then_upload(
+                folder, self.device_limiter, self.upload_scheduler, *self.upload_args
+            )
+        except Exception as e:
+            logging.error(f"Processing {folder} failed: {e}")
+        finally:
+            self.busy_folders.discard(folder)
+
+    async def check_drives(self) -> None:
+        """Starts an ingest for each newly connected card."""
+        drives = await asyncio.to_thread(detect_drives)
+        for name, drive in drives.items():
+            if self.ingested_drives.get(name) != drive:
+                logging.info(f"{name} connected at {drive}, ingesting")
+                self.ingested_drives[name] = drive
+                self._spawn(self._ingest(name, drive))
+        # Forget removed cards so they are ingested again when re-inserted
+        for name in set(self.ingested_drives) - set(drives):
+            del self.ingested_drives[name]
+
+    async def check_input_folders(self) -> None:
+        """Starts combining each input or staging folder whose clips have settled."""
+        scanned = await asyncio.to_thread(scan_input_folders)
+        now = time.monotonic()
+        for folder, (snapshot, holds_clips) in scanned.items():
+            if folder in self.busy_folders:
+                continue
+            previous, changed_at = self.snapshots.get(folder, (None, now))
+            if snapshot != previous:
+                self.snapshots[folder] = (snapshot, now)
+                continue
+            if (
+                snapshot
+                and snapshot != self.combined.get(folder)
+                and now - changed_at >= self.settle_seconds
+                and holds_clips
+            ):
+                logging.info(f"{folder} settled, combining")
+                self.combined[folder] = snapshot
+                self._spawn(self._combine(folder))
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        def notify() -> None:
+            loop.call_soon_threadsafe(self.wake.set)
+
+        def mounts_changed() -> None:
+            self.mounts_changed = True
+            self.wake.set()
+
+        def notify_mounts() -> None:
+            loop.call_soon_threadsafe(mounts_changed)
+
+        INPUT_VIDEO_FOLDER_PATH.mkdir(parents=True, exist_ok=True)
+        stop = threading.Event()
+        mount_events = sys.platform.startswith("linux") and MOUNTS_FILE.exists()
+        if mount_events:
+            threading.Thread(
+                target=watch_mounts, args=(notify_mounts, stop), daemon=True
+            ).start()
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(
+                InputEventHandler(notify), str(INPUT_VIDEO_FOLDER_PATH), recursive=True
+            )
+            observer.start()
+        logging.info(
+            f"Watching for cards and {INPUT_VIDEO_FOLDER_PATH} "
+            f"({'watchdog' if observer else 'polling'})"
+        )
+
+        timed_out = False
+        try:
+            while True:
+                # Cleared before scanning, so a change during a scan wakes the next pass
+                self.wake.clear()
+                if self.mounts_changed or (timed_out and not mount_events):
+                    self.mounts_changed = False
+                    await self.check_drives()
+                await self.check_input_folders()
+                # Wake on the next change, or in time to see a pending folder settle
+                timeout = self.poll_interval
+                if any(
+                    snapshot and snapshot != self.combined.get(folder)
+                    for folder, (snapshot, _) in self.snapshots.items()
+                ):
+                    timeout = min(timeout, self.settle_seconds / 3)
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout)
+                    timed_out = False
+                except asyncio.TimeoutError:
+                    timed_out = True
+        finally:
+            stop.set()
+            if observer:
+                observer.stop()
+                observer.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(
+        WatchService(
+            tags=["cycling", "ride", "singapore"],
+            category_id=17,
+            privacy_status="private",
+            max_upload_retries=3,
+        ).run()
+    )
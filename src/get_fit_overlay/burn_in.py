@@ -0,0 +1,87 @@
+import datetime
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+from dashboard import generate_dashboard
+
+# combine_video is a sibling script folder rather than an installed package
+COMBINE_VIDEO_DIR = Path(__file__).resolve().parent.parent / "combine_video"
+if str(COMBINE_VIDEO_DIR) not in sys.path:
+    sys.path.append(str(COMBINE_VIDEO_DIR))
+
+from get_video_recording_time import get_video_recording_time  # noqa: E402
+from media_info import probe_media  # noqa: E402
+
+LAYOUT_FOLDER = Path("C:/Python Projects/dashcam")
+LAYOUT_1080P = LAYOUT_FOLDER / "power-1920x1080.xml"
+LAYOUT_4K = LAYOUT_FOLDER / "power-4k.xml"
+# Videos at least this wide get the 4K layout
+UHD_WIDTH = 3840
+# get_video_recording_time reports local time (UTC+8) in this format
+RECORDING_TIME_FORMAT = "%Y%m%d_%H%M%S"
+RECORDING_TIMEZONE = datetime.timezone(datetime.timedelta(hours=8))
+
+
+def video_start_time(video_file: Path) -> datetime.datetime:
+    """Returns when a video started recording, as a timezone-aware datetime."""
+    return datetime.datetime.strptime(
+        get_video_recording_time(video_file), RECORDING_TIME_FORMAT
+    ).replace(tzinfo=RECORDING_TIMEZONE)
+
+
+def layout_for_width(width: Optional[int]) -> Path:
+    """Picks the dashboard layout drawn for a video of the given width."""
+    return LAYOUT_4K if width and width >= UHD_WIDTH else LAYOUT_1080P
+
+
+def burn_in_dashboard(
+    video_file: Path,
+    fit: Path,
+    output: Path,
+    font: str = "verdana",
+    layout_xml: Optional[Path] = None,
+    **kwargs,
+) -> None:
+    """
+    Renders the FIT dashboard straight onto a combined ride video.
+
+    The video is aligned to the FIT data by its recording time and the
+    overlay is composited while the video is re-encoded, so it is decoded
+    and encoded once and no intermediate alpha overlay file is written.
+
+    Args:
+        video_file: Combined ride video from combine_video
+        fit: FIT (or GPX) file recorded during the ride
+        output: Path of the video with the dashboard burnt in
+        font: Font used by the layout
+        layout_xml: Layout to draw, defaults to one matching the video width
+        **kwargs: Further generate_dashboard arguments
+    """
+    info = probe_media(video_file)
+    start = video_start_time(video_file)
+    layout_xml = layout_xml or layout_for_width(info.width)
+    logging.info(
+        f"Burning {fit.name} into {video_file.name} "
+        f"({info.width}x{info.height}, starts {start.isoformat()}, layout {layout_xml.name})"
+    )
+    generate_dashboard(
+        input=video_file,
+        output=output,
+        fit=fit,
+        font=font,
+        overlay_size=f"{info.width}x{info.height}",
+        layout_xml=layout_xml,
+        video_start=start,
+        **kwargs,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    burn_in_dashboard(
+        Path("C:/Video/Output/20240501_060000_Test.mp4"),
+        Path("C:/Video/FIT/18404524116.fit"),
+        Path("C:/Video/Dashboard/20240501_060000_Test.mp4"),
+    )
@@ -1,10 +1,14 @@
 #!C:\Python Projects\dashcam\venv\Scripts\python.exe
+import contextlib
 import datetime
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from importlib import metadata
 from importlib.metadata import PackageNotFoundError
 from pathlib import Path
 from typing import Optional
+from xml.etree import ElementTree
 
 from gopro_overlay import timeseries_process, gpmd_filters
 from gopro_overlay.arguments import gopro_dashboard_arguments
@@ -20,21 +24,55 @@ from gopro_overlay.ffmpeg import FFMPEG
 from gopro_overlay.ffmpeg_gopro import FFMPEGGoPro
 from gopro_overlay.ffmpeg_overlay import FFMPEGNull, FFMPEGOverlay, FFMPEGOverlayVideo
 from gopro_overlay.ffmpeg_profile import load_ffmpeg_profile
+from gopro_overlay.functional import flatten
 from gopro_overlay.font import load_font
 from gopro_overlay.framemeta_gpx import merge_gpx_with_gopro, timeseries_to_framemeta
 from gopro_overlay.geo import MapRenderer, api_key_finder, MapStyler
 from gopro_overlay.gpmf import GPS_FIXED_VALUES, GPSFix
 from gopro_overlay.layout import Overlay, speed_awareness_layout
-from gopro_overlay.layout_xml import layout_from_xml, load_xml_layout, Converters
+from gopro_overlay.layout_xml import (
+    layout_from_xml,
+    load_xml_layout,
+    Converters,
+    date_formatter_from,
+)
 from gopro_overlay.loading import load_external, GoproLoader
 from gopro_overlay.log import log, fatal
 from gopro_overlay.point import Point
 from gopro_overlay.privacy import PrivacyZone, NoPrivacyZone
-from gopro_overlay.progresstrack import ProgressBarProgress
+from gopro_overlay.progresstrack import ProgressBarProgress, ProgressTracker
 from gopro_overlay.timeunits import timeunits, Timeunit
 from gopro_overlay.timing import PoorTimer, Timers
 from gopro_overlay.units import units
 from gopro_overlay.widgets.profile import WidgetProfiler
+from PIL import Image
+
+from frame_ring import RING_SLOTS, RingBuffer
+from text_cache import CachingFont
+
+# Worker processes for segmented rendering, each drawing one contiguous time range.
+# Opt-in: 1 renders in this process, os.cpu_count() uses every core
+RENDER_WORKERS = 1
+# Segment files are named <output stem>.partNNN<suffix> next to the output
+SEGMENT_INFIX = ".part"
+# A decimated render is encoded as <output stem>.body<suffix> and its last frame as .tail
+BODY_INFIX = ".body"
+TAIL_INFIX = ".tail"
+# Seconds of video between overlay frames
+FRAME_INTERVAL = 0.1
+# Garmin FIT files hold one sample per second, so steps within one share a frame
+SAMPLE_INTERVAL = timeunits(seconds=1)
+# Drops frames identical to the last one kept, so only data changes are encoded
+DECIMATE_FILTER = "mpdecimate=hi=0:lo=0:frac=0"
+# Sample counters that advance every sample whatever the ride does, and the
+# metrics that draw them; charts also scroll on "timestamp"
+SAMPLE_COUNTERS = {
+    "timestamp": {"timestamp"},
+    "packet": {"gps-packet"},
+    "packet_index": {"gps-packet-index"},
+    "grad_other_packet": set(),
+    "grad_other_packet_index": set(),
+}
 
 
 def accepter_from_args(include, exclude):
@@ -107,6 +145,155 @@ def fmtdt(dt: datetime.datetime):
     return dt.replace(microsecond=0).isoformat()
 
 
+@dataclass(frozen=True, slots=True)
+class LayoutTime:
+    """How an XML layout shows the passing of time."""
+
+    # (format, truncate) of every datetime widget
+    clocks: tuple[tuple[str, int], ...]
+    # SAMPLE_COUNTERS no widget draws
+    hidden_counters: frozenset[str]
+
+
+def layout_time(layout, layout_xml, dimensions) -> Optional[LayoutTime]:
+    """
+    Reads which clocks and sample counters a layout draws.
+
+    None if the layout is not XML, so it is unknown what it shows.
+    """
+    if layout_xml:
+        xml = load_xml_layout(Path(layout_xml))
+    elif layout == "default":
+        try:
+            xml = load_xml_layout(Path(f"default-{dimensions.x}x{dimensions.y}"))
+        except FileNotFoundError:
+            return None
+    else:
+        return None
+    components = list(ElementTree.fromstring(xml).iter("component"))
+    metrics = {component.get("metric") for component in components}
+    if any(component.get("type") == "chart" for component in components):
+        metrics.add("timestamp")
+    return LayoutTime(
+        clocks=tuple(
+            (component.get("format"), int(component.get("truncate", 0)))
+            for component in components
+            if component.get("type") == "datetime"
+        ),
+        hidden_counters=frozenset(
+            name for name, drawn_by in SAMPLE_COUNTERS.items() if not drawn_by & metrics
+        ),
+    )
+
+
+def frame_key(entry, shown: Optional[LayoutTime] = None) -> int:
+    """
+    Hashes the values an overlay frame is drawn from.
+
+    With the layout's ``shown`` time, the timestamp only counts as the text
+    its clocks show and counters it does not draw are left out, so a
+    stationary sample keys the same as the one before. Without it every
+    value counts.
+    """
+    if shown is None:
+        return hash(
+            (entry.dt, tuple(sorted((name, repr(value)) for name, value in entry.items.items())))
+        )
+    shown_time = tuple(
+        date_formatter_from(lambda: entry, format_string, truncate)()
+        for format_string, truncate in shown.clocks
+    )
+    return hash(
+        (
+            shown_time,
+            tuple(
+                sorted(
+                    (name, repr(value))
+                    for name, value in entry.items.items()
+                    if name not in shown.hidden_counters
+                )
+            ),
+        )
+    )
+
+
+class FrameReuser:
+    """
+    Redraws the overlay only when the data behind it changes.
+
+    Each step is snapped to the start of its sample interval and keyed on a
+    hash of the values the layout shows for that sample (see frame_key).
+    While the key stays the same the previous raster is pasted in instead of
+    drawing every widget again, so ffmpeg receives a repeated frame that the
+    encoder codes as skipped blocks.
+    """
+
+    def __init__(
+        self,
+        overlay: Overlay,
+        sample_interval: Optional[Timeunit],
+        shown: Optional[LayoutTime] = None,
+    ):
+        self.overlay = overlay
+        self.sample_interval = sample_interval
+        self.shown = shown
+        self.previous_key: Optional[int] = None
+        self.previous_frame: Optional[Image.Image] = None
+        self.drawn = 0
+        self.reused = 0
+
+    def draw(self, pts: Timeunit, frame: Image.Image) -> None:
+        if self.sample_interval is None:
+            self.overlay.draw(pts, frame)
+            self.drawn += 1
+            return
+        pts = pts.align(self.sample_interval)
+        key = frame_key(self.overlay.framemeta.get(pts), self.shown)
+        if key == self.previous_key:
+            frame.paste(self.previous_frame)
+            self.reused += 1
+            return
+        self.overlay.draw(pts, frame)
+        self.previous_key = key
+        self.previous_frame = frame.copy()
+        self.drawn += 1
+
+    def __str__(self):
+        return f"Frames drawn: {self.drawn:,}, reused: {self.reused:,}"
+
+
+class FFMPEGDecimatedOverlay(FFMPEGOverlay):
+    """
+    Overlay writer that encodes a frame only when it differs from the last one.
+
+    Repeated frames are dropped before the encoder and the rest keep their
+    original timestamps (variable frame rate), instead of every frame being
+    duplicated up to a constant 30fps. A kept frame lasts until the next one,
+    so the final frame has to be written separately (see render_dashboard)
+    or the repeats trailing it are lost from the length.
+    """
+
+    @contextlib.contextmanager
+    def generate(self):
+        cmd = flatten([
+            "-hide_banner",
+            "-y",
+            self.options.general,
+            "-f", "rawvideo",
+            "-framerate", str(1 / FRAME_INTERVAL),
+            "-s", f"{self.overlay_size.x}x{self.overlay_size.y}",
+            "-pix_fmt", "rgba",
+            "-i", "-",
+            "-vf", DECIMATE_FILTER,
+            "-fps_mode", "vfr",
+            self.options.output,
+            "-metadata", f"creation_time={self.creation_time.isoformat()}",
+            str(self.output)
+        ])
+
+        yield from self.exe.execute(self.execution, cmd)
+
+
 def generate_args_list(
     input: Optional[str | Path] = None,
     output: Optional[str | Path] = "output_video.mp4",
@@ -284,6 +471,63 @@ def generate_args_list(
     return args_list
 
 
+def segment_bounds(frame_count: int, index: int, count: int) -> tuple[int, Optional[int]]:
+    """
+    Returns the first and end step of one of ``count`` contiguous segments.
+
+    The last segment is open-ended, so it also picks up any step that
+    ``len(stepper)`` rounds away.
+    """
+    first = frame_count * index // count
+    end = frame_count * (index + 1) // count if index < count - 1 else None
+    return first, end
+
+
+def segment_path(output: Path, index: int) -> Path:
+    return output.with_name(f"{output.stem}{SEGMENT_INFIX}{index:03d}{output.suffix}")
+
+
+def infix_path(output: Path, infix: str) -> Path:
+    return output.with_name(f"{output.stem}{infix}{output.suffix}")
+
+
+def concat_segments(
+    segments: list[Path],
+    frame_counts: list[int],
+    output: Path,
+    ffmpeg_dir: Optional[str | Path] = None,
+) -> None:
+    """
+    Joins rendered segments into one file with the concat demuxer, without re-encoding.
+
+    Each segment's duration comes from its frame count rather than the file,
+    so the joins stay on exact frame boundaries.
+    """
+    concat_list = output.with_suffix(".txt")
+    concat_list.write_text(
+        "".join(
+            f"file '{segment.absolute().as_posix()}'\n"
+            f"duration {frame_count * FRAME_INTERVAL:.3f}\n"
+            for segment, frame_count in zip(segments, frame_counts)
+        )
+    )
+    try:
+        FFMPEG(location=Path(ffmpeg_dir) if ffmpeg_dir else None).run(
+            [
+                "-hide_banner",
+                "-loglevel", "error",
+                "-y",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", str(concat_list),
+                "-c", "copy",
+                str(output),
+            ]
+        )
+    finally:
+        concat_list.unlink(missing_ok=True)
+
+
 def generate_dashboard(
     output: Optional[str | Path] = "output_video.mp4",
     fit: Optional[str | Path] = Path("C:/Python Projects/dashcam/18404524116.fit"),
@@ -293,23 +537,113 @@ def generate_dashboard(
         "C:/Python Projects/dashcam/power-1920x1080.xml"
     ),
     privacy: Optional[str] = "1.442770, 103.808006, 2", # (lat, long, km)
+    render_workers: int = RENDER_WORKERS,
+    sample_interval: Optional[Timeunit] = SAMPLE_INTERVAL,
+    ring_slots: int = RING_SLOTS,
+    video_start: Optional[datetime.datetime] = None,
     **kwargs
     
 
 ) -> None:
-    """Generate the dashboard."""
-    # Define the arguments as a list
-    args_list = generate_args_list(
-        output=output,
-        fit=fit,
-        font=font,
-        overlay_size=overlay_size,
-        layout_xml=layout_xml,
-        privacy=privacy,
-        **kwargs
-    )
-    # Call the function with the arguments
+    """
+    Generate the dashboard.
+
+    With more than one render worker the timeline is split into that many
+    contiguous time ranges, each drawn into its own file by a separate
+    process, and the files are then joined without re-encoding. Only a
+    standalone overlay (no input video) can be rendered this way. Workers
+    beyond the number of frames get empty ranges and are left out of the
+    join; if any worker is interrupted, nothing is joined.
+
+    Steps within one ``sample_interval`` of the data reuse the same frame;
+    pass None to draw every step from interpolated values.
+
+    Frames are drawn into a ring of ``ring_slots`` buffers that a writer
+    thread feeds to ffmpeg; 1 draws and writes each frame in turn.
+
+    ``video_start`` aligns an input video to the GPX/FIT data when it is
+    known from elsewhere than the file's own timestamps.
+    """
+    def args_for(output_path) -> list[str]:
+        return generate_args_list(
+            output=output_path,
+            fit=fit,
+            font=font,
+            overlay_size=overlay_size,
+            layout_xml=layout_xml,
+            privacy=privacy,
+            **kwargs
+        )
+
+    if render_workers > 1 and kwargs.get("input") is not None:
+        log("Segmented rendering needs a standalone overlay, rendering on one core")
+        render_workers = 1
+    if render_workers <= 1:
+        render_dashboard(
+            args_for(output),
+            sample_interval=sample_interval,
+            ring_slots=ring_slots,
+            video_start=video_start,
+        )
+        return
+
+    output = Path(output)
+    segments = [segment_path(output, index) for index in range(render_workers)]
+    log(f"Rendering {render_workers} segments in parallel")
+    try:
+        with ProcessPoolExecutor(max_workers=render_workers) as executor:
+            futures = [
+                executor.submit(
+                    render_dashboard,
+                    args_for(segment),
+                    (index, render_workers),
+                    sample_interval,
+                    ring_slots,
+                )
+                for index, segment in enumerate(segments)
+            ]
+            frame_counts = [future.result() for future in futures]
+        if None in frame_counts:
+            log("Rendering was interrupted, segments not joined")
+            return
+        rendered = [(segment, count) for segment, count in zip(segments, frame_counts) if count]
+        output.unlink(missing_ok=True)
+        concat_segments(
+            [segment for segment, _ in rendered],
+            [count for _, count in rendered],
+            output,
+            kwargs.get("ffmpeg_dir"),
+        )
+    finally:
+        for segment in segments:
+            segment.unlink(missing_ok=True)
+
+
+def render_dashboard(
+    args_list: list[str],
+    segment: Optional[tuple[int, int]] = None,
+    sample_interval: Optional[Timeunit] = SAMPLE_INTERVAL,
+    ring_slots: int = RING_SLOTS,
+    video_start: Optional[datetime.datetime] = None,
+) -> Optional[int]:
+    """
+    Renders the dashboard described by a gopro-dashboard argument list.
+
+    Args:
+        args_list (list): Arguments as built by generate_args_list.
+        segment (tuple, optional): (index, count) to draw only that contiguous
+            part of the timeline, for segmented rendering.
+        sample_interval (Timeunit, optional): Spacing of the recorded data;
+            steps in between reuse the frame drawn at its start.
+        ring_slots (int, optional): Frames that can be drawn ahead of ffmpeg.
+        video_start (datetime, optional): When the input video started
+            recording, overriding --video-time-start/--video-time-end.
+
+    Returns:
+        int: Number of frames rendered, or None if interrupted.
+    """
     args = gopro_dashboard_arguments(args_list)
+    frame_count: Optional[int] = None
 
     try:
         version = metadata.version("gopro_overlay")
@@ -342,7 +676,8 @@ def generate_dashboard(
         )
 
     try:
-        font = load_font(args.font)
+        # Every size the layout asks for shares one text raster cache
+        font = CachingFont.from_font(load_font(args.font))
     except OSError:
         fatal(
             f"Unable to load font '{args.font}' - use --font to choose a font that is installed."
@@ -401,6 +736,10 @@ def generate_dashboard(
                             )
                             end_date = start_date + duration.timedelta()
 
+                        if video_start is not None:
+                            start_date = video_start
+                            end_date = start_date + duration.timedelta()
+
                     else:
                         generate = "overlay"
 
@@ -587,13 +926,48 @@ def generate_dashboard(
 
                 output: Path = args.output
 
+                draw_timer = PoorTimer("drawing frames")
+
+                # Draw an overlay frame every 0.1 seconds of video
+                timelapse_correction = frame_meta.duration() / video_duration
+                log(f"Timelapse Factor = {timelapse_correction:.3f}")
+                stepper = frame_meta.stepper(
+                    timeunits(seconds=FRAME_INTERVAL * timelapse_correction)
+                )
+                # len(stepper) can be one out from what the steps produce
+                steps = list(stepper.steps())
+                frame_count = len(steps)
+                if segment is not None:
+                    if generate != "overlay":
+                        fatal("Segmented rendering only supports overlay output")
+                    first, end = segment_bounds(frame_count, *segment)
+                    steps = steps[first:end]
+                    frame_count = len(steps)
+                    log(f"Segment {segment[0] + 1}/{segment[1]}: {frame_count} frames from step {first}")
+                    if frame_count == 0:
+                        # More workers than frames, nothing for this one to draw
+                        return frame_count
+                    # One bar per worker would garble the console
+                    progress = ProgressTracker()
+                else:
+                    progress = ProgressBarProgress("Render")
+
+                # The last frame of a decimated render is encoded on its own, then joined
+                # with its true start time so the repeats before it keep their length
+                split_tail = generate == "overlay" and sample_interval is not None and frame_count > 1
+                body_output = infix_path(output, BODY_INFIX) if split_tail else output
+                tail_output = infix_path(output, TAIL_INFIX)
+                overlay_writer = (
+                    FFMPEGOverlay if sample_interval is None else FFMPEGDecimatedOverlay
+                )
+
                 if generate == "none":
                     ffmpeg = FFMPEGNull()
                 elif generate == "overlay":
                     output.unlink(missing_ok=True)
-                    ffmpeg = FFMPEGOverlay(
+                    ffmpeg = overlay_writer(
                         ffmpeg=ffmpeg_exe,
-                        output=output,
+                        output=body_output,
                         options=ffmpeg_options,
                         overlay_size=dimensions,
                         execution=execution,
@@ -609,16 +983,6 @@ def generate_dashboard(
                         execution=execution,
                     )
 
-                draw_timer = PoorTimer("drawing frames")
-
-                # Draw an overlay frame every 0.1 seconds of video
-                timelapse_correction = frame_meta.duration() / video_duration
-                log(f"Timelapse Factor = {timelapse_correction:.3f}")
-                stepper = frame_meta.stepper(
-                    timeunits(seconds=0.1 * timelapse_correction)
-                )
-                progress = ProgressBarProgress("Render")
-
                 unit_converters = Converters(
                     speed_unit=args.units_speed,
                     distance_unit=args.units_distance,
@@ -641,9 +1005,14 @@ def generate_dashboard(
                 )
 
                 overlay = Overlay(framemeta=frame_meta, create_widgets=layout_creator)
+                reuser = FrameReuser(
+                    overlay,
+                    sample_interval,
+                    layout_time(args.layout, args.layout_xml, dimensions),
+                )
 
                 try:
-                    progress.start(len(stepper))
+                    progress.start(frame_count)
                     with ffmpeg.generate() as writer:
 
                         if args.double_buffer:
@@ -652,32 +1021,63 @@ def generate_dashboard(
                                 "Please raise issues if you see it working or not-working. Thanks ***"
                             )
                             buffer = DoubleBuffer(dimensions, args.bg, writer)
+                        elif ring_slots > 1:
+                            buffer = RingBuffer(dimensions, args.bg, writer, ring_slots)
                         else:
                             buffer = SingleBuffer(dimensions, args.bg, writer)
 
                         with buffer:
-                            for index, dt in enumerate(stepper.steps()):
+                            for index, dt in enumerate(steps[:-1] if split_tail else steps):
                                 progress.update(index)
                                 draw_timer.time(
                                     lambda: buffer.draw(
-                                        lambda frame: overlay.draw(dt, frame)
+                                        lambda frame: reuser.draw(dt, frame)
                                     )
                                 )
 
+                        if isinstance(buffer, RingBuffer):
+                            log(buffer)
+
+                    if split_tail:
+                        tail_writer = FFMPEGDecimatedOverlay(
+                            ffmpeg=ffmpeg_exe,
+                            output=tail_output,
+                            options=ffmpeg_options,
+                            overlay_size=dimensions,
+                            execution=execution,
+                        )
+                        with tail_writer.generate() as writer:
+                            SingleBuffer(dimensions, args.bg, writer).draw(
+                                lambda frame: reuser.draw(steps[-1], frame)
+                            )
+                        concat_segments(
+                            [body_output, tail_output],
+                            [frame_count - 1, 1],
+                            output,
+                            args.ffmpeg_dir,
+                        )
+
                     log("Finished drawing frames. waiting for ffmpeg to catch up")
                     progress.complete()
 
                 finally:
-                    for t in [draw_timer]:
+                    if split_tail:
+                        body_output.unlink(missing_ok=True)
+                        tail_output.unlink(missing_ok=True)
+                    for t in [draw_timer, reuser]:
                         log(t)
 
                     if profiler:
                         log("\n\n*** Widget Timings ***")
                         profiler.print()
+                        log(font.cache)
                         log("***\n\n")
 
     except KeyboardInterrupt:
         log("User interrupted...")
+        return None
+
+    return frame_count
 
 
 if __name__ == "__main__":
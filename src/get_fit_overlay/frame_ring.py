@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from io import BufferedWriter
+from typing import Any, Callable, Optional, Tuple
+
+from gopro_overlay.buffering import DrawBuffer, raw_image
+from gopro_overlay.dimensions import Dimension
+from PIL import Image
+
+# Frames that can be drawn ahead of ffmpeg before drawing has to wait
+RING_SLOTS = 4
+# How often a waiting side wakes to check whether the other side failed
+WAIT_TIMEOUT = 1.0
+
+
+class RingBuffer(DrawBuffer):
+    """
+    Draws into an N-slot ring of preallocated RGBA frames while a writer thread feeds ffmpeg.
+
+    Each slot is a bytearray that PIL draws into directly and that is handed
+    to the pipe as a memoryview, so a frame is never copied between drawing
+    and writing. Drawing only waits when every slot is still queued for the
+    pipe; the writer only waits when nothing has been drawn yet. Both waits
+    are counted so a render reports which side was the bottleneck.
+    """
+
+    def __init__(
+        self,
+        size: Dimension,
+        background: Optional[Tuple],
+        writer: BufferedWriter,
+        slots: int = RING_SLOTS,
+    ):
+        self.writer = writer
+        self.slots = [bytearray(size.x * size.y * 4) for _ in range(slots)]
+        self.images = [raw_image(size, slot) for slot in self.slots]
+        self.blank = Image.new("RGBA", (size.x, size.y), background or (0, 0, 0, 0)).tobytes()
+
+        self.free: queue.Queue[int] = queue.Queue()
+        self.filled: queue.Queue[Optional[int]] = queue.Queue()
+        for index in range(slots):
+            self.free.put(index)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._write_frames, daemon=True)
+
+        self.frames = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.draw_stalls = 0
+        self.draw_stall_seconds = 0.0
+        self.write_waits = 0
+        self.write_wait_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def _check(self) -> None:
+        if self.error is not None:
+            raise IOError(f"Frame writer failed: {self.error}") from self.error
+
+    def _write_frames(self) -> None:
+        try:
+            while True:
+                try:
+                    index = self.filled.get_nowait()
+                except queue.Empty:
+                    started = time.monotonic()
+                    index = self.filled.get()
+                    self.write_waits += 1
+                    self.write_wait_seconds += time.monotonic() - started
+                if index is None:
+                    return
+                started = time.monotonic()
+                self.writer.write(memoryview(self.slots[index]))
+                self.write_seconds += time.monotonic() - started
+                self.free.put(index)
+        except BaseException as e:
+            self.error = e
+
+    def _next_free(self) -> int:
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        started = time.monotonic()
+        self.draw_stalls += 1
+        try:
+            while True:
+                self._check()
+                try:
+                    return self.free.get(timeout=WAIT_TIMEOUT)
+                except queue.Empty:
+                    continue
+        finally:
+            self.draw_stall_seconds += time.monotonic() - started
+
+    def draw(self, f: Callable[[Image.Image], Any]):
+        self._check()
+        index = self._next_free()
+        self.slots[index][:] = self.blank
+        f(self.images[index])
+
+        depth = self.filled.qsize() + 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+        self.frames += 1
+        self.filled.put(index)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.filled.put(None)
+        while self.thread.is_alive():
+            self.thread.join(timeout=WAIT_TIMEOUT)
+        for image in self.images:
+            image.close()
+        if exc_type is None:
+            self._check()
+
+    def __str__(self):
+        mean_depth = self.depth_total / self.frames if self.frames else 0.0
+        return (
+            f"RingBuffer({len(self.slots)} slots) - Frames: {self.frames:,}, "
+            f"Queue depth: mean {mean_depth:.2f} max {self.max_depth}, "
+            f"Draw stalls: {self.draw_stalls:,} ({self.draw_stall_seconds:.2f}s), "
+            f"Writer idle: {self.write_waits:,} ({self.write_wait_seconds:.2f}s), "
+            f"Writing: {self.write_seconds:.2f}s"
+        )
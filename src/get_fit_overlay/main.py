@@ -1,12 +1,17 @@
 import logging
 import os
 from pathlib import Path
+from typing import Optional
 from download_fit_file import download_latest_activity
 from dashboard import generate_dashboard
+from burn_in import burn_in_dashboard
 
 MAIN_VIDEO_FOLDER = Path("C:/Video/")
 FIT_FOLDER = MAIN_VIDEO_FOLDER / "FIT"
 OVERLAY_FOLDER = MAIN_VIDEO_FOLDER / "Overlay"
+DASHBOARD_VIDEO_FOLDER = MAIN_VIDEO_FOLDER / "Dashboard"
+# Combined ride to burn the dashboard into; None renders a standalone overlay
+COMBINED_VIDEO_PATH: Optional[Path] = None
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
@@ -19,12 +24,17 @@ if __name__ == "__main__":
     os.makedirs(FIT_FOLDER, exist_ok=True)
     os.makedirs(OVERLAY_FOLDER, exist_ok=True)
     latest_fit_file = download_latest_activity(output_folder=FIT_FOLDER, start_index=0)
-    output_overlay_file = OVERLAY_FOLDER / latest_fit_file.with_suffix(".mp4")
-    generate_dashboard(
-        fit=latest_fit_file,
-        output=output_overlay_file,
-        font="verdana",
-        overlay_size="1920x1080",
-        layout_xml=Path(r"C:\Python Projects\dashcam\power-1920x1080.xml"),
-    )
-    logging.info(f"Video exported to {output_overlay_file}")
+    if COMBINED_VIDEO_PATH:
+        os.makedirs(DASHBOARD_VIDEO_FOLDER, exist_ok=True)
+        output_video_file = DASHBOARD_VIDEO_FOLDER / COMBINED_VIDEO_PATH.name
+        burn_in_dashboard(COMBINED_VIDEO_PATH, latest_fit_file, output_video_file)
+    else:
+        output_video_file = OVERLAY_FOLDER / latest_fit_file.with_suffix(".mp4")
+        generate_dashboard(
+            fit=latest_fit_file,
+            output=output_video_file,
+            font="verdana",
+            overlay_size="1920x1080",
+            layout_xml=Path(r"C:\Python Projects\dashcam\power-1920x1080.xml"),
+        )
+    logging.info(f"Video exported to {output_video_file}")
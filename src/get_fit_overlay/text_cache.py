@@ -0,0 +1,217 @@
+import itertools
+import math
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from PIL import Image, ImageChops, ImageFont
+
+# Rendered text masks kept across all fonts before the least recently used is dropped
+TEXT_CACHE_ENTRIES = 4096
+# Numeric strings made only of these are composed from per-character sprites
+ATLAS_CHARACTERS = frozenset("0123456789.,-+: ")
+# Anchors the atlas can reproduce: vertical ones must be font-wide metrics, not glyph extents
+ATLAS_H_ANCHORS = ("l", "m", "r")
+ATLAS_V_ANCHORS = ("a", "s", "d")
+# Sprites are rendered at this many sub-pixel horizontal phases
+SUBPIXEL_STEPS = 4
+
+_font_tokens = itertools.count()
+
+
+class TextRasterCache:
+    """
+    LRU cache of rendered text masks, shared by every CachingFont of a render.
+
+    Counts how text was produced so the profiler can show whether layouts
+    actually hit the cache.
+    """
+
+    def __init__(self, max_entries: int = TEXT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Hashable, tuple[Any, tuple[int, int]]] = OrderedDict()
+        self.hits = 0
+        self.composed = 0
+        self.rendered = 0
+
+    def get(self, key: Hashable) -> Optional[tuple[Any, tuple[int, int]]]:
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return cached
+
+    def put(self, key: Hashable, value: tuple[Any, tuple[int, int]]) -> None:
+        self.entries[key] = value
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __str__(self):
+        lookups = self.hits + self.composed + self.rendered
+        hit_rate = 100 * self.hits / lookups if lookups else 0.0
+        return (
+            f"Text raster cache - Hits: {self.hits:,} ({hit_rate:.1f}%), "
+            f"Atlas: {self.composed:,}, Rendered: {self.rendered:,}, "
+            f"Entries: {len(self.entries):,}/{self.max_entries:,}"
+        )
+
+
+class CachingFont(ImageFont.FreeTypeFont):
+    """
+    FreeType font that reuses rendered text instead of rasterising it every frame.
+
+    PIL draws all text through ``getmask2``, so caching the returned coverage
+    masks serves every text and metric widget, including those with
+    ``cache="False"``; colour is applied when the mask is composited, so it is
+    not part of the key. Numeric strings that miss the cache are assembled
+    from a per-font atlas of character sprites, so a value that changes
+    every frame (e.g. lat/lon) costs a few pastes rather than a layout and
+    rasterisation. Sprites are placed at each character's advance without
+    kerning, which is how tabular digits are laid out anyway.
+    """
+
+    def __init__(
+        self,
+        font=None,
+        size: float = 10,
+        index: int = 0,
+        encoding: str = "",
+        layout_engine=None,
+        cache: Optional[TextRasterCache] = None,
+    ):
+        super().__init__(font, size, index, encoding, layout_engine)
+        self.cache = cache if cache is not None else TextRasterCache()
+        self.token = next(_font_tokens)
+        self.sprites: dict[Hashable, tuple[Image.Image, tuple[int, int]]] = {}
+        self.advances: dict[str, float] = {}
+
+    @classmethod
+    def from_font(
+        cls, font: ImageFont.FreeTypeFont, cache: Optional[TextRasterCache] = None
+    ) -> "CachingFont":
+        return cls(font.path, font.size, font.index, font.encoding, font.layout_engine, cache)
+
+    def font_variant(
+        self, font=None, size=None, index=None, encoding=None, layout_engine=None
+    ) -> "CachingFont":
+        return CachingFont(
+            font=self.path if font is None else font,
+            size=self.size if size is None else size,
+            index=self.index if index is None else index,
+            encoding=self.encoding if encoding is None else encoding,
+            layout_engine=self.layout_engine if layout_engine is None else layout_engine,
+            cache=self.cache,
+        )
+
+    def _advance(self, char: str, mode: str) -> float:
+        advance = self.advances.get(char)
+        if advance is None:
+            advance = self.advances[char] = self.getlength(char, mode)
+        return advance
+
+    def _sprite(
+        self, char: str, mode: str, stroke_width: float, vertical: str, phase: float, kwargs: dict
+    ) -> tuple[Image.Image, tuple[int, int]]:
+        key = (char, mode, stroke_width, vertical, phase, tuple(sorted(kwargs.items())))
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            mask, offset = super().getmask2(
+                char,
+                mode,
+                stroke_width=stroke_width,
+                anchor="l" + vertical,
+                start=(phase, 0),
+                **kwargs,
+            )
+            sprite = self.sprites[key] = (Image.Image()._new(mask), offset)
+        return sprite
+
+    def _compose(
+        self,
+        text: str,
+        mode: str,
+        stroke_width: float,
+        anchor: Optional[str],
+        start_x: float,
+        kwargs: dict,
+    ) -> tuple[Any, tuple[int, int]]:
+        """Assembles a text mask from character sprites, matching getmask2's offset convention."""
+        anchor = anchor or "la"
+        width = sum(self._advance(char, mode) for char in text)
+        # FreeType snaps the anchor to a whole pixel, then starts the pen at the fractional x
+        pen = math.floor({"l": 0.0, "m": -width / 2, "r": -width}[anchor[0]]) + start_x
+
+        placed = []
+        for char in text:
+            # Each character is drawn from the sprite rendered nearest its sub-pixel position
+            whole, step = divmod(round(pen * SUBPIXEL_STEPS), SUBPIXEL_STEPS)
+            image, (x, y) = self._sprite(
+                char, mode, stroke_width, anchor[1], step / SUBPIXEL_STEPS, kwargs
+            )
+            placed.append((image, whole + x, y))
+            pen += self._advance(char, mode)
+        left = min(x for _, x, _ in placed)
+        top = min(y for _, _, y in placed)
+        right = max(x + image.width for image, x, _ in placed)
+        bottom = max(y + image.height for image, _, y in placed)
+
+        canvas = Image.new("L", (max(right - left, 1), max(bottom - top, 1)))
+        for image, x, y in placed:
+            # Union (max) of coverage, so overlapping outlines do not cut into each other
+            box = (x - left, y - top, x - left + image.width, y - top + image.height)
+            canvas.paste(ImageChops.lighter(canvas.crop(box), image), box)
+        return canvas.im, (left, top)
+
+    def getmask2(
+        self,
+        text,
+        mode="",
+        direction=None,
+        features=None,
+        language=None,
+        stroke_width=0,
+        anchor=None,
+        ink=0,
+        start=None,
+        *args,
+        **kwargs,
+    ):
+        key = (
+            self.token,
+            text,
+            mode,
+            direction,
+            tuple(features) if features else None,
+            language,
+            stroke_width,
+            anchor,
+            ink if mode == "RGBA" else None,
+            start,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if (
+            mode == "L"
+            and isinstance(text, str)
+            and len(text) > 1
+            and ATLAS_CHARACTERS.issuperset(text)
+            and not (direction or features or language or args)
+            # Sprites are only phased horizontally
+            and not (start and start[1])
+            and (anchor is None or (anchor[:1] in ATLAS_H_ANCHORS and anchor[1:] in ATLAS_V_ANCHORS))
+        ):
+            result = self._compose(
+                text, mode, stroke_width, anchor, start[0] if start else 0.0, kwargs
+            )
+            self.cache.composed += 1
+        else:
+            result = super().getmask2(
+                text, mode, direction, features, language, stroke_width, anchor, ink, start,
+                *args, **kwargs,
+            )
+            self.cache.rendered += 1
+        self.cache.put(key, result)
+        return result